@@ -0,0 +1,139 @@
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+ANALYTICS_FILE = "analytics.json"
+# Ogni esecuzione scrive il proprio segmento: due workflow paralleli non toccano mai lo stesso file
+EVENTS_DIR = "analytics_events"
+ROLLUPS_FILE = "analytics_rollups.json"
+# Quanti giorni/settimane di storico tenere nei riepiloghi
+KEEP_DAYS = 90
+KEEP_WEEKS = 104
+
+
+def parse_view(text):
+    """'VIEW: Nome | Secondi' (o solo 'Nome | Secondi') -> (nome, secondi)."""
+    if text.startswith("VIEW: "):
+        text = text.replace("VIEW: ", "", 1)
+    parts = text.split("|")
+    name = parts[0].strip()
+    duration = int(parts[1].strip()) if len(parts) > 1 and parts[1].strip().isdigit() else 0
+    return name, duration
+
+
+def segment_path(now=None):
+    now = now or datetime.now(timezone.utc)
+    run_id = os.environ.get("GITHUB_RUN_ID") or f"{int(time.time() * 1000)}-{os.getpid()}"
+    return os.path.join(EVENTS_DIR, f"{now.strftime('%Y-%m-%d')}-{run_id}.jsonl")
+
+
+def record_views(views, now=None):
+    """Aggiunge in coda molte visualizzazioni (nome, secondi) con una sola scrittura."""
+    if not views:
+        return None
+    now = now or datetime.now(timezone.utc)
+    os.makedirs(EVENTS_DIR, exist_ok=True)
+    path = segment_path(now)
+    stamp = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    with open(path, "a", encoding="utf-8") as f:
+        for name, seconds in views:
+            f.write(json.dumps({"name": name, "seconds": seconds, "at": stamp}, ensure_ascii=False) + "\n")
+    return path
+
+
+def normalize_totals(analytics):
+    """
+    Porta il vecchio analytics.json al formato {nome: {"views", "time"}}:
+    i contatori interi diventano oggetti e le chiavi del tipo "Avicii | 10" vengono
+    ricondotte al nome, sommando i secondi che contenevano.
+    """
+    totals = {}
+    for key, value in analytics.items():
+        name, seconds = parse_view(key)
+        if isinstance(value, int):
+            views, spent = value, seconds * value
+        else:
+            views, spent = value.get("views", 0), value.get("time", 0)
+        entry = totals.setdefault(name, {"views": 0, "time": 0})
+        entry["views"] += views
+        entry["time"] += spent
+    return totals
+
+
+def load_json(path, default):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            try: return json.load(f)
+            except: pass
+    return default
+
+
+def save_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def bump(bucket, name, seconds):
+    entry = bucket.setdefault(name, {"views": 0, "time": 0})
+    entry["views"] += 1
+    entry["time"] += seconds
+
+
+def fold_events(lines, totals, rollups):
+    """Somma le righe di un segmento nei totali per persona e nei riepiloghi; restituisce quante erano."""
+    events = 0
+    for line in lines:
+        try: event = json.loads(line)
+        except: continue  # Riga troncata: si ignora
+        name, seconds = event["name"], event.get("seconds", 0)
+        day = datetime.strptime(event["at"][:10], "%Y-%m-%d")
+        week = "%d-W%02d" % day.isocalendar()[:2]
+        bump(totals, name, seconds)
+        bump(rollups["daily"].setdefault(day.strftime("%Y-%m-%d"), {}), name, seconds)
+        bump(rollups["weekly"].setdefault(week, {}), name, seconds)
+        events += 1
+    return events
+
+
+def reduce_segments():
+    """Somma tutti i segmenti nei totali per persona e nei riepiloghi giornalieri e settimanali."""
+    totals = normalize_totals(load_json(ANALYTICS_FILE, {}))
+    rollups = load_json(ROLLUPS_FILE, {"daily": {}, "weekly": {}, "folded": []})
+    folded = set(rollups.get("folded", []))
+
+    segments = sorted(f for f in os.listdir(EVENTS_DIR) if f.endswith(".jsonl")) if os.path.isdir(EVENTS_DIR) else []
+    events = 0
+    newly_folded = []
+    for filename in segments:
+        if filename in folded:
+            continue
+        with open(os.path.join(EVENTS_DIR, filename), "r", encoding="utf-8") as f:
+            events += fold_events(f, totals, rollups)
+        newly_folded.append(filename)
+
+    # Storico limitato: i riepiloghi più vecchi non servono alla dashboard
+    rollups["daily"] = dict(sorted(rollups["daily"].items())[-KEEP_DAYS:])
+    rollups["weekly"] = dict(sorted(rollups["weekly"].items())[-KEEP_WEEKS:])
+    # Prima si salvano i totali, poi si eliminano i segmenti: se il processo si interrompe nel mezzo,
+    # l'elenco "folded" impedisce di contare due volte lo stesso segmento
+    rollups["folded"] = sorted(folded | set(newly_folded))
+    save_json(ANALYTICS_FILE, totals)
+    save_json(ROLLUPS_FILE, rollups)
+    for filename in newly_folded + [f for f in segments if f in folded]:
+        os.remove(os.path.join(EVENTS_DIR, filename))
+    rollups["folded"] = []
+    save_json(ROLLUPS_FILE, rollups)
+    print(f"📊 {events} visualizzazioni da {len(newly_folded)} segmenti sommate in {ANALYTICS_FILE}.")
+    return totals
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "reduce":
+        reduce_segments()
+    elif len(sys.argv) > 2 and sys.argv[1] == "append":
+        path = record_views([parse_view(arg) for arg in sys.argv[2:]])
+        print(f"📊 Visualizzazioni aggiunte in {path}.")
@@ -0,0 +1,272 @@
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from name_index import normalize_name
+
+# Registro delle azioni degli admin. Il vecchio admin_logs.json è un unico array che il client iOS
+# riscrive per intero a ogni azione; qui le voci finiscono in segmenti JSONL in sola aggiunta,
+# uno per mese (e un nuovo pezzo quando il mese supera SEGMENT_BYTES), con un indice accanto
+# che dice in quali segmenti compare ogni admin, azione e scheda.
+LEGACY_FILE = "admin_logs.json"
+AUDIT_DIR = "admin_audit"
+INDEX_FILE = os.path.join(AUDIT_DIR, "index.json")
+SEGMENT_BYTES = 1024 * 1024
+# Voci lasciate in admin_logs.json dopo la compattazione, per la schermata del client
+KEEP_LEGACY = 200
+# Il campo "date" è in secondi dal 1° gennaio 2001 (data di riferimento di Apple)
+APPLE_EPOCH = 978307200
+INDEXED_FIELDS = ["actor", "action", "name"]
+
+
+def to_datetime(apple_seconds):
+    return datetime.fromtimestamp(apple_seconds + APPLE_EPOCH, timezone.utc)
+
+
+def to_apple(moment):
+    return moment.timestamp() - APPLE_EPOCH
+
+
+def parse_day(text):
+    # "2026-03-01" -> secondi Apple di quel giorno (UTC)
+    return to_apple(datetime.strptime(text, "%Y-%m-%d").replace(tzinfo=timezone.utc))
+
+
+def index_key(field, value):
+    # I nomi delle schede si confrontano normalizzati, come nel resto della biblioteca
+    return normalize_name(value) if field == "name" else (value or "")
+
+
+def segment_name(month, part=0):
+    return f"{month}.jsonl" if part == 0 else f"{month}.{part}.jsonl"
+
+
+def segment_month(filename):
+    return filename.split(".")[0]
+
+
+def load_json(path, default):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            try: return json.load(f)
+            except: pass
+    return default
+
+
+def save_json(path, data, indent=None):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_segment(filename):
+    entries = []
+    path = os.path.join(AUDIT_DIR, filename)
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try: entries.append(json.loads(line))
+            except: continue  # Riga troncata da un'interruzione: si ignora
+    return entries
+
+
+def list_segments():
+    if not os.path.isdir(AUDIT_DIR):
+        return []
+    return sorted(f for f in os.listdir(AUDIT_DIR) if f.endswith(".jsonl"))
+
+
+class AuditIndex:
+    """
+    Indice dei segmenti: per ognuno numero di voci, byte e intervallo di date; per ogni admin,
+    azione e nome di scheda l'elenco dei segmenti in cui compare. Resta piccolo perché punta
+    ai segmenti e non alle singole voci.
+    """
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.segments = data.get("segments", {})
+        self.keys = {field: data.get(field, {}) for field in INDEXED_FIELDS}
+
+    @classmethod
+    def load(cls):
+        data = load_json(INDEX_FILE, None)
+        # Indice mancante o illeggibile: lo si ricostruisce dai segmenti, che sono la fonte di verità
+        return cls(data) if data is not None else cls.rebuild()
+
+    @classmethod
+    def rebuild(cls):
+        index = cls()
+        for filename in list_segments():
+            index.segments[filename] = {"entries": 0, "bytes": os.path.getsize(os.path.join(AUDIT_DIR, filename))}
+            for entry in read_segment(filename):
+                index.add(filename, entry)
+        return index
+
+    def add(self, filename, entry, size=0):
+        segment = self.segments.setdefault(filename, {"entries": 0, "bytes": 0})
+        segment["entries"] += 1
+        segment["bytes"] += size
+        date = entry.get("date", 0)
+        segment["first"] = min(segment.get("first", date), date)
+        segment["last"] = max(segment.get("last", date), date)
+        for field in INDEXED_FIELDS:
+            files = self.keys[field].setdefault(index_key(field, entry.get(field)), [])
+            if filename not in files:
+                files.append(filename)
+
+    def current_segment(self, month):
+        # L'ultimo pezzo del mese, o uno nuovo se quello ha superato la dimensione massima
+        parts = [f for f in self.segments if segment_month(f) == month]
+        if not parts:
+            return segment_name(month)
+        last = max(parts, key=lambda f: int(f.split(".")[1]) if f.count(".") == 2 else 0)
+        if self.segments[last]["bytes"] < SEGMENT_BYTES:
+            return last
+        part = int(last.split(".")[1]) + 1 if last.count(".") == 2 else 1
+        return segment_name(month, part)
+
+    def candidates(self, actor=None, action=None, name=None, since=None, until=None):
+        """Segmenti che possono contenere voci con quei filtri (le voci vanno poi controllate una a una)."""
+        files = set(self.segments)
+        for field, value in (("actor", actor), ("action", action), ("name", name)):
+            if value is not None:
+                files &= set(self.keys[field].get(index_key(field, value), []))
+        if since is not None:
+            files = {f for f in files if self.segments[f].get("last", 0) >= since}
+        if until is not None:
+            files = {f for f in files if self.segments[f].get("first", 0) < until}
+        return sorted(files)
+
+    def save(self):
+        os.makedirs(AUDIT_DIR, exist_ok=True)
+        data = {"segments": self.segments}
+        data.update(self.keys)
+        save_json(INDEX_FILE, data)
+
+
+def append_many(entries, index=None):
+    """Aggiunge le voci in coda ai segmenti del loro mese: si scrivono solo le righe nuove e l'indice."""
+    if not entries:
+        return 0
+    os.makedirs(AUDIT_DIR, exist_ok=True)
+    if index is None:
+        index = AuditIndex.load()
+    for entry in entries:
+        filename = index.current_segment(to_datetime(entry.get("date", 0)).strftime("%Y-%m"))
+        line = json.dumps(entry, ensure_ascii=False, sort_keys=True) + "\n"
+        with open(os.path.join(AUDIT_DIR, filename), "a", encoding="utf-8") as f:
+            f.write(line)
+        index.add(filename, entry, len(line.encode("utf-8")))
+    index.save()
+    return len(entries)
+
+
+def append(action, name, actor="Server", date=None):
+    # Stesso formato delle voci scritte dal client iOS
+    entry = {
+        "id": str(uuid.uuid4()).upper(),
+        "actor": actor,
+        "action": action,
+        "name": name,
+        "date": date if date is not None else to_apple(datetime.now(timezone.utc)),
+    }
+    append_many([entry])
+    return entry
+
+
+def query(name=None, actor=None, action=None, since=None, until=None, limit=None):
+    """
+    Voci che rispettano tutti i filtri, dalla più recente. `since` e `until` sono secondi Apple
+    (until escluso). Si leggono solo i segmenti che l'indice indica come possibili.
+    """
+    index = AuditIndex.load()
+    wanted = {field: index_key(field, value) for field, value in (("actor", actor), ("action", action), ("name", name)) if value is not None}
+    results = []
+    for filename in index.candidates(actor, action, name, since, until):
+        for entry in read_segment(filename):
+            if any(index_key(field, entry.get(field)) != key for field, key in wanted.items()):
+                continue
+            date = entry.get("date", 0)
+            if (since is not None and date < since) or (until is not None and date >= until):
+                continue
+            results.append(entry)
+    results.sort(key=lambda e: e.get("date", 0), reverse=True)
+    return results[:limit] if limit else results
+
+
+def entry_key(entry):
+    return entry.get("id") or json.dumps(entry, sort_keys=True)
+
+
+def compact():
+    """
+    Porta nei segmenti le voci di admin_logs.json che non ci sono ancora (per id) e aggiorna
+    l'indice solo per quelle. Si leggono soltanto i segmenti dei mesi che compaiono nel file del
+    client e nessun segmento viene riscritto. In admin_logs.json restano solo le ultime KEEP_LEGACY
+    voci, così il client continua a mostrarle ma non riscrive più tutto lo storico.
+    """
+    legacy = load_json(LEGACY_FILE, [])
+    index = AuditIndex.load()
+    months = {to_datetime(entry.get("date", 0)).strftime("%Y-%m") for entry in legacy}
+    known = set()
+    for filename in index.segments:
+        if segment_month(filename) in months:
+            known.update(entry_key(entry) for entry in read_segment(filename))
+    new = []
+    for entry in sorted(legacy, key=lambda e: (e.get("date", 0), e.get("id", ""))):
+        key = entry_key(entry)
+        if key not in known:
+            known.add(key)
+            new.append(entry)
+    append_many(new, index)
+
+    if len(legacy) > KEEP_LEGACY:
+        # Stesso ordine del client: dalla più recente
+        recent = sorted(legacy, key=lambda e: e.get("date", 0), reverse=True)[:KEEP_LEGACY]
+        save_json(LEGACY_FILE, recent, indent=2)
+    total = sum(segment["entries"] for segment in index.segments.values())
+    print(f"🗂️ Registro admin: {total} voci in {len(index.segments)} segmenti ({len(new)} nuove da {LEGACY_FILE}).")
+    return total
+
+
+def option(argv, name, default=None):
+    return argv[argv.index(name) + 1] if name in argv and argv.index(name) + 1 < len(argv) else default
+
+
+def print_entries(entries):
+    for entry in entries:
+        when = to_datetime(entry.get("date", 0)).strftime("%Y-%m-%d %H:%M")
+        print(f"{when}  {entry.get('actor', '')}: {entry.get('action', '')} -> {entry.get('name', '')}")
+
+
+if __name__ == "__main__":
+    # python audit_log.py compact
+    # python audit_log.py query [--name "Marilyn Monroe"] [--actor "Admin iOS"] [--action Approvato] [--from 2026-01-01] [--to 2026-02-01] [--limit 20]
+    # python audit_log.py append --action "Avvio Script" --name update_bios [--actor Server]
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "compact":
+        compact()
+    elif command == "query":
+        since, until = option(sys.argv, "--from"), option(sys.argv, "--to")
+        limit = option(sys.argv, "--limit")
+        print_entries(query(
+            name=option(sys.argv, "--name"),
+            actor=option(sys.argv, "--actor"),
+            action=option(sys.argv, "--action"),
+            since=parse_day(since) if since else None,
+            until=parse_day(until) if until else None,
+            limit=int(limit) if limit else None,
+        ))
+    elif command == "append" and option(sys.argv, "--action"):
+        entry = append(option(sys.argv, "--action"), option(sys.argv, "--name", ""), option(sys.argv, "--actor", "Server"))
+        print(f"🗂️ Voce aggiunta al registro admin: {entry['action']} -> {entry['name']}")
+    elif command == "reindex":
+        AuditIndex.rebuild().save()
+        print("🗂️ Indice del registro admin ricostruito.")
+    else:
+        sys.exit("Uso: python audit_log.py compact | query [filtri] | append --action A --name N | reindex")
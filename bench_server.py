@@ -0,0 +1,324 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Server finto che imita i servizi usati dagli script: riassunti REST e ricerca di Wikipedia,
+# endpoint SPARQL di Wikidata e foto. Le risposte sono sintetiche ma deterministiche (dipendono
+# solo dallo slug o dalla query), oppure lette da un file di risposte registrate.
+# Latenza, errori 5xx e 429 si regolano da riga di comando per riprodurre un servizio lento o instabile.
+SAMPLE_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images", "dan_simmons_1772325283.jpg")
+UPSTREAM_WIKIPEDIA = "https://{lang}.wikipedia.org"
+UPSTREAM_SPARQL = "https://query.wikidata.org/sparql"
+USER_AGENT = 'iMissYouApp_Bench/1.0 (https://github.com/Gimmons1)'
+
+
+def seed(text):
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def fake_date(h, start=1900, end=2025):
+    year = start + h % max(end - start + 1, 1)
+    return f"{year:04d}-{1 + h % 12:02d}-{1 + h % 28:02d}T00:00:00Z" if year >= 0 else f"-{-year:04d}-01-01T00:00:00Z"
+
+
+class StandIn:
+    """Stato condiviso del server: parametri dei guasti simulati, risposte registrate e contatori."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_429=0.0, retry_after=1,
+                 missing_rate=0.05, people=5000, deaths_per_year=40, fixtures=None, record=False, random_seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.missing_rate = missing_rate
+        self.people = people
+        self.deaths_per_year = deaths_per_year
+        self.fixtures_path = fixtures
+        self.record = record
+        self.fixtures = {}
+        if fixtures and os.path.exists(fixtures):
+            with open(fixtures, "r", encoding="utf-8") as f:
+                self.fixtures = json.load(f)
+        self.random = random.Random(random_seed)
+        self.lock = threading.Lock()
+        self.wiki_base = ""
+        self.stats = {}
+
+    # --- Contatori ---
+
+    def count(self, endpoint, status, size):
+        with self.lock:
+            entry = self.stats.setdefault(endpoint, {"requests": 0, "bytes": 0, "statuses": {}})
+            entry["requests"] += 1
+            entry["bytes"] += size
+            entry["statuses"][str(status)] = entry["statuses"].get(str(status), 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+    # --- Guasti simulati ---
+
+    def fault(self):
+        """Attende la latenza configurata e, a caso, restituisce uno stato di errore da simulare."""
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            roll = self.random.random()
+        if delay:
+            time.sleep(delay)
+        if roll < self.rate_429:
+            return 429
+        if roll < self.rate_429 + self.error_rate:
+            return 503
+        return None
+
+    # --- Risposte registrate ---
+
+    def recorded(self, key, upstream_url, body=None):
+        if key in self.fixtures:
+            return self.fixtures[key]
+        if not self.record:
+            return None
+        # Modalità registrazione: la richiesta va al servizio vero e la risposta viene salvata
+        request = urllib.request.Request(upstream_url, data=body, headers={"User-Agent": USER_AGENT, "Accept": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as res:
+                fixture = {"status": res.status, "body": json.loads(res.read().decode("utf-8"))}
+        except urllib.error.HTTPError as e:
+            fixture = {"status": e.code, "body": {}}
+        with self.lock:
+            self.fixtures[key] = fixture
+            with open(self.fixtures_path, "w", encoding="utf-8") as f:
+                json.dump(self.fixtures, f, indent=2, ensure_ascii=False, sort_keys=True)
+        return fixture
+
+    # --- Risposte sintetiche ---
+
+    def summary(self, lang, slug):
+        h = seed(f"{lang}:{slug}")
+        if h % 1000 < self.missing_rate * 1000:
+            return 404, {"type": "https://mediawiki.org/wiki/HyperSwitch/errors/not_found"}
+        title = urllib.parse.unquote(slug).replace("_", " ")
+        data = {
+            "type": "standard",
+            "title": title,
+            "titles": {"canonical": slug, "normalized": title},
+            "extract": f"{title} è un personaggio del server di prova. " * (1 + h % 12),
+            "revision": str(h % 1000000),
+        }
+        if h % 3:
+            data["originalimage"] = {"source": f"{self.wiki_base}/images/{h % 50}.jpg", "width": 800, "height": 1000}
+        return 200, data
+
+    def search(self, query):
+        h = seed(query)
+        titles = [query] + [f"{query} ({kind})" for kind in ("attore", "cantante", "scrittore")[:h % 4]]
+        return 200, {"query": {"search": [{"title": t} for t in titles]}}
+
+    def person_binding(self, k, start, end):
+        h = seed(f"person:{k}")
+        slug = f"Persona_Sintetica_{k:06d}"
+        binding = {
+            "person": {"value": f"http://www.wikidata.org/entity/Q{90000000 + k}"},
+            "personLabel": {"value": slug.replace("_", " ")},
+            "birthDate": {"value": fake_date(h, start - 90, start - 20)},
+            "deathDate": {"value": fake_date(h >> 3, start, end)},
+            "sitelinks": {"value": str(40 + h % 200)},
+            "article": {"value": f"https://en.wikipedia.org/wiki/{slug}"},
+            "modified": {"value": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")},
+        }
+        if h % 2:
+            binding["image"] = {"value": f"{self.wiki_base}/images/{h % 50}.jpg"}
+        return binding
+
+    def sparql(self, query):
+        values = re.search(r"VALUES \?article \{([^}]*)\}", query)
+        bindings = []
+        if values:
+            # Risoluzione a blocchi di wikidata_batch: una riga per articolo esistente
+            for iri in re.findall(r"<([^>]+)>", values.group(1)):
+                h = seed(iri)
+                if h % 1000 < self.missing_rate * 1000:
+                    continue
+                binding = {
+                    "article": {"value": iri},
+                    "item": {"value": f"http://www.wikidata.org/entity/Q{h % 10000000}"},
+                    "birthDate": {"value": fake_date(h, 1880, 1960)},
+                }
+                if h % 10:
+                    binding["deathDate"] = {"value": fake_date(h >> 4, 1961, 2025)}
+                if h % 4 == 0:
+                    binding["causeLabel"] = {"value": ("infarto", "tumore", "incidente stradale")[h % 3]}
+                if h % 2:
+                    binding["image"] = {"value": f"{self.wiki_base}/images/{h % 50}.jpg"}
+                bindings.append(binding)
+        elif "wd:Q5" in query:
+            # Ricerche del radar e dell'importatore storico: persone sintetiche numerate
+            limit = int((re.search(r"LIMIT (\d+)", query) or [0, 50])[1])
+            offset = int((re.search(r"OFFSET (\d+)", query) or [0, 0])[1])
+            years = re.search(r"YEAR\(\?deathDate\) >= (-?\d+) && YEAR\(\?deathDate\) <= (-?\d+)", query)
+            start, end = (int(years.group(1)), int(years.group(2))) if years else (2024, 2025)
+            total = self.people
+            marks = re.findall(r'"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ)"\^\^xsd:dateTime', query)
+            if marks and not years:
+                # Radar incrementale: tante persone quante ne sono morte dall'ultimo segnalibro
+                since = datetime.strptime(max(marks), "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+                days = max((datetime.now(timezone.utc) - since).total_seconds() / 86400, 0)
+                total = min(self.people, math.ceil(self.deaths_per_year * days / 365))
+            if years:
+                # Fasce dell'importatore storico: tante persone quante ne muoiono in quel periodo
+                months = 1 if re.search(r"MONTH\(\?deathDate\) = \d+", query) else 12 * (end - start + 1)
+                total = min(self.people, self.deaths_per_year * months // 12)
+            # Stessa ricerca, stesse persone: la pagina (LIMIT/OFFSET) non cambia chi viene restituito
+            base = seed(re.sub(r"(LIMIT|OFFSET) \d+", "", query)) % 1000 * 1000
+            for k in range(offset, min(offset + limit, total)):
+                bindings.append(self.person_binding(base + k, start, end))
+        return 200, {"head": {"vars": []}, "results": {"bindings": bindings}}
+
+
+def make_handler(standin, service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, endpoint, status, body=None, content_type="application/json", headers=None):
+            if status == 304:
+                payload = b""
+            else:
+                payload = body if isinstance(body, bytes) else json.dumps(body or {}, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+            standin.count(endpoint, status, len(payload))
+
+        def handle_request(self, body=None):
+            parsed = urllib.parse.urlparse(self.path)
+            params = urllib.parse.parse_qs(parsed.query)
+            if body:
+                params.update(urllib.parse.parse_qs(body.decode("utf-8")))
+            parts = parsed.path.strip("/").split("/")
+
+            if service == "sparql":
+                endpoint = "sparql"
+            elif len(parts) >= 2 and parts[0] == "images":
+                endpoint = "images"
+            elif "summary" in parts:
+                endpoint = "summary"
+            else:
+                endpoint = "search"
+
+            failure = standin.fault()
+            if failure:
+                headers = {"Retry-After": str(standin.retry_after)} if failure == 429 else {}
+                return self.reply(endpoint, failure, {"error": "simulato"}, headers=headers)
+
+            if endpoint == "images":
+                with open(SAMPLE_IMAGE, "rb") as f:
+                    return self.reply(endpoint, 200, f.read(), "image/jpeg", {"ETag": '"sample"'})
+
+            key = f"{self.command} {self.path}" + (f" {hashlib.sha1(body).hexdigest()}" if body else "")
+            if endpoint == "sparql":
+                query = params.get("query", [""])[0]
+                fixture = standin.recorded(key, UPSTREAM_SPARQL, body or urllib.parse.urlencode({"query": query, "format": "json"}).encode())
+                status, data = (fixture["status"], fixture["body"]) if fixture else standin.sparql(query)
+                return self.reply(endpoint, status, data, "application/sparql-results+json")
+
+            lang = parts[0]
+            upstream = UPSTREAM_WIKIPEDIA.format(lang=lang) + "/" + "/".join(parts[1:]) + (f"?{parsed.query}" if parsed.query else "")
+            fixture = standin.recorded(key, upstream)
+            if fixture:
+                status, data = fixture["status"], fixture["body"]
+            elif endpoint == "summary":
+                status, data = standin.summary(lang, parts[-1])
+            else:
+                status, data = standin.search(params.get("srsearch", [""])[0])
+
+            etag = f'"{seed(json.dumps(data, sort_keys=True))}"'
+            if status == 200 and self.headers.get("If-None-Match") == etag:
+                return self.reply(endpoint, 304, headers={"ETag": etag})
+            return self.reply(endpoint, status, data, headers={"ETag": etag} if status == 200 else None)
+
+        def do_GET(self):
+            self.handle_request()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.handle_request(self.rfile.read(length) if length else None)
+
+    return Handler
+
+
+def serve(standin, host="127.0.0.1", wiki_port=8801, sparql_port=8802):
+    """
+    Avvia i due servizi finti in thread separati (porta 0 = porta libera qualsiasi).
+    Restituisce (server_wikipedia, server_sparql, variabili d'ambiente per gli script).
+    """
+    wiki = ThreadingHTTPServer((host, wiki_port), make_handler(standin, "wikipedia"))
+    sparql = ThreadingHTTPServer((host, sparql_port), make_handler(standin, "sparql"))
+    for server in (wiki, sparql):
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    standin.wiki_base = f"http://{host}:{wiki.server_address[1]}"
+    env = {
+        "WIKIPEDIA_URL": standin.wiki_base + "/{lang}",
+        "WIKIDATA_SPARQL_URL": f"http://{host}:{sparql.server_address[1]}/sparql",
+    }
+    return wiki, sparql, env
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.02, help="latenza fissa in secondi")
+    parser.add_argument("--jitter", type=float, default=0.01, help="latenza casuale aggiuntiva in secondi")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="quota di risposte 503")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="quota di risposte 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="secondi indicati nel Retry-After dei 429")
+    parser.add_argument("--missing-rate", type=float, default=0.05, help="quota di pagine inesistenti")
+    parser.add_argument("--deaths-per-year", type=int, default=40, help="persone per anno nelle ricerche per fascia dello storico")
+    parser.add_argument("--fixtures", help="file JSON di risposte registrate (chiave: 'METODO percorso')")
+    parser.add_argument("--record", action="store_true", help="registra nel file fixtures le risposte dei servizi veri")
+
+
+def standin_from_args(args):
+    return StandIn(args.latency, args.jitter, args.error_rate, args.rate_429, args.retry_after,
+                   args.missing_rate, deaths_per_year=args.deaths_per_year, fixtures=args.fixtures, record=args.record)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server finto di Wikipedia e Wikidata per test e benchmark")
+    parser.add_argument("--wiki-port", type=int, default=8801)
+    parser.add_argument("--sparql-port", type=int, default=8802)
+    add_arguments(parser)
+    args = parser.parse_args()
+    if args.record and not args.fixtures:
+        parser.error("--record richiede --fixtures")
+    _, _, env = serve(standin_from_args(args), wiki_port=args.wiki_port, sparql_port=args.sparql_port)
+    print("🧪 Server finto attivo. Per usarlo:")
+    for key, value in env.items():
+        print(f"   export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
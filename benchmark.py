@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_server import add_arguments, serve, standin_from_args
+
+# Benchmark degli script contro il server finto di bench_server.py, su biblioteche sintetiche
+# di varie dimensioni. Per ogni script misura tempo totale, richieste e byte per servizio
+# (contati dal server) e picco di memoria del processo.
+#
+#   python benchmark.py --sizes 700,10000 --scripts bio_updater,auto_fixer --rate-429 0.01
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SIZES = [700, 10000, 100000]
+RESULTS_FILE = "bench_results.json"
+
+SCRIPTS = {
+    "updater": ["updater.py"],
+    "historical_importer": ["historical_importer.py"],
+    "bio_updater": ["bio_updater.py"],
+    "auto_fixer": ["auto_fixer.py"],
+    "request_processor": ["request_processor.py", "--batch", "commands.txt"],
+}
+
+# Avvia lo script come __main__ e a fine corsa scrive il picco di memoria (ru_maxrss, KB su Linux)
+RUNNER = """
+import resource, runpy, sys
+script = sys.argv[1]
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(script, run_name="__main__")
+finally:
+    with open("peak_memory.txt", "w") as f:
+        f.write(str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+"""
+
+
+def synthetic_library(size, image_base):
+    """Biblioteca finta ma plausibile: bio corte, cause mancanti e foto assenti in proporzioni fisse."""
+    library = []
+    for i in range(size):
+        slug = f"Persona_Sintetica_{i:06d}"
+        bio = f"{slug.replace('_', ' ')} è un personaggio di prova. " * (1 if i % 5 == 0 else 8)
+        if i % 3 == 0:
+            bio = f"⚕️ Causa del decesso: Infarto.\n\n{bio}"
+        year = 1900 + i % 125
+        library.append({
+            "name": slug.replace("_", " "),
+            "slugs": {"IT": slug, "EN": slug},
+            "bio": bio,
+            "birthDate": f"{year - 70:04d}-01-01",
+            "deathDate": f"{year:04d}-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            "imageUrl": None if i % 7 == 0 else f"{image_base}/images/{i % 50}.jpg",
+            "approved": True,
+        })
+    library.sort(key=lambda r: r["deathDate"])
+    return library
+
+
+def synthetic_commands(size):
+    commands = [f"VIEW: Persona Sintetica {i * 7 % size:06d} | {i % 90}" for i in range(20)]
+    commands += [f"APPROVE: Persona Sintetica {i * 11 % size:06d}" for i in range(10)]
+    commands += [f"USER_REQUEST: Nuovo Personaggio {i}" for i in range(10)]
+    commands += [f"DELETE: Persona Sintetica {i * 13 % size:06d}" for i in range(5)]
+    return commands
+
+
+def run_script(name, run_dir, env, timeout):
+    command = [sys.executable, "-c", RUNNER, os.path.join(REPO_DIR, SCRIPTS[name][0])] + SCRIPTS[name][1:]
+    started = time.perf_counter()
+    with open(os.path.join(run_dir, "output.log"), "w", encoding="utf-8") as log:
+        try:
+            code = subprocess.run(command, cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT, timeout=timeout).returncode
+        except subprocess.TimeoutExpired:
+            code = "timeout"
+    elapsed = time.perf_counter() - started
+    peak = None
+    peak_path = os.path.join(run_dir, "peak_memory.txt")
+    if os.path.exists(peak_path):
+        with open(peak_path) as f:
+            peak = int(f.read().strip() or 0)
+    return code, elapsed, peak
+
+
+def run_benchmark(sizes, scripts, standin, rate_scale, timeout, workdir=None):
+    _, _, server_env = serve(standin, wiki_port=0, sparql_port=0)
+    root = workdir or tempfile.mkdtemp(prefix="imissyou-bench-")
+    results = []
+    for size in sizes:
+        library = synthetic_library(size, standin.wiki_base)
+        for name in scripts:
+            run_dir = os.path.join(root, f"{size}-{name}")
+            shutil.rmtree(run_dir, ignore_errors=True)
+            os.makedirs(run_dir)
+            with open(os.path.join(run_dir, "library.json"), "w", encoding="utf-8") as f:
+                json.dump(library, f, indent=2, ensure_ascii=False)
+            with open(os.path.join(run_dir, "commands.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(synthetic_commands(size)) + "\n")
+
+            env = dict(os.environ, **server_env)
+            env["PYTHONPATH"] = os.pathsep.join(p for p in [REPO_DIR, os.environ.get("PYTHONPATH")] if p)
+            env["SUMMARY_CACHE_FILE"] = os.path.join(run_dir, ".cache", "wiki_summaries.sqlite")
+            env["FETCH_RATE_SCALE"] = str(rate_scale)
+
+            print(f"⏱️  {name} su {size} schede...")
+            standin.reset()
+            code, elapsed, peak = run_script(name, run_dir, env, timeout)
+            stats = standin.snapshot()
+            result = {
+                "size": size,
+                "script": name,
+                "exitCode": code,
+                "wallSeconds": round(elapsed, 3),
+                "requests": sum(s["requests"] for s in stats.values()),
+                "bytes": sum(s["bytes"] for s in stats.values()),
+                "peakMemoryKB": peak,
+                "endpoints": stats,
+            }
+            results.append(result)
+            if code != 0:
+                print(f"   ⚠️ uscita {code}, vedi {os.path.join(run_dir, 'output.log')}")
+    return results, root
+
+
+def print_table(results):
+    print(f"\n{'script':<20} {'schede':>8} {'secondi':>9} {'richieste':>10} {'KB':>10} {'mem MB':>8}  esito")
+    for r in results:
+        memory = f"{r['peakMemoryKB'] / 1024:.1f}" if r["peakMemoryKB"] else "-"
+        print(f"{r['script']:<20} {r['size']:>8} {r['wallSeconds']:>9.2f} {r['requests']:>10} "
+              f"{r['bytes'] / 1024:>10.1f} {memory:>8}  {'ok' if r['exitCode'] == 0 else r['exitCode']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark degli script contro il server finto")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SIZES), help="dimensioni delle biblioteche sintetiche")
+    parser.add_argument("--scripts", default=",".join(SCRIPTS), help="script da misurare")
+    parser.add_argument("--rate-scale", type=float, default=1.0, help="moltiplica i limiti di velocità per host")
+    parser.add_argument("--timeout", type=int, default=3600, help="secondi massimi per ogni esecuzione")
+    parser.add_argument("--workdir", help="cartella in cui lasciare biblioteche, log e cache delle esecuzioni")
+    parser.add_argument("--output", default=RESULTS_FILE)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    scripts = [s.strip() for s in args.scripts.split(",") if s.strip()]
+    unknown = [s for s in scripts if s not in SCRIPTS]
+    if unknown:
+        parser.error(f"script sconosciuti: {', '.join(unknown)}")
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    results, root = run_benchmark(sizes, scripts, standin_from_args(args), args.rate_scale, args.timeout, args.workdir)
+    print_table(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"settings": vars(args), "results": results}, f, indent=2, ensure_ascii=False)
+    print(f"\n📈 Risultati salvati in {args.output} (esecuzioni in {root}).")
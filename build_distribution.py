@@ -0,0 +1,138 @@
+import gzip
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+from changelog import build_patches
+from dates import DATES_FILE, build_date_indexes, year_of
+from image_pipeline import SIZES, ThumbnailIndex
+from library_store import LibraryStore
+from search_index import SEARCH_FILE, build_index
+
+try:
+    import brotli
+except ImportError:
+    # Brotli è facoltativo: senza il modulo si pubblicano solo i file minificati e gzip
+    brotli = None
+
+JSON_FILE = "library.json"
+DIST_DIR = "dist"
+# Campi leggeri che l'App mostra nelle liste: tutto tranne la biografia
+INDEX_FIELDS = ["name", "slugs", "birthDate", "deathDate", "imageUrl", "approved"]
+
+
+def death_year(record):
+    # "-0034-05-11" -> -34, "1991-11-24" -> 1991
+    year = year_of(record.get("deathDate", ""))
+    return year if year is not None else 0
+
+
+def shard_name(record, shard_by="decade"):
+    year = death_year(record)
+    if shard_by == "year":
+        return str(year)
+    return f"{year // 10 * 10}s"
+
+
+def minify(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_if_changed(path, content):
+    # Se il contenuto è identico il file non viene toccato, così git non vede modifiche inutili
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read() == content:
+                return False
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+
+def publish(relative_path, content, manifest):
+    """Scrive un file della distribuzione con le sue varianti compresse e lo registra nel manifesto."""
+    path = os.path.join(DIST_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_if_changed(path, content)
+    # mtime=0: lo stesso contenuto produce sempre lo stesso .gz (e lo stesso hash)
+    gz = gzip.compress(content, compresslevel=9, mtime=0)
+    write_if_changed(path + ".gz", gz)
+    entry = {
+        "sha256": hashlib.sha256(content).hexdigest(),
+        "bytes": len(content),
+        "gzipBytes": len(gz),
+    }
+    if brotli is not None:
+        br = brotli.compress(content, quality=11)
+        write_if_changed(path + ".br", br)
+        entry["brotliBytes"] = len(br)
+    manifest["files"][relative_path] = entry
+
+
+def build_distribution(shard_by="decade"):
+    store = LibraryStore(JSON_FILE)
+    library = store.to_list()
+    thumbs = ThumbnailIndex()
+
+    index = []
+    shards = {}
+    for record in library:
+        shard = shard_name(record, shard_by)
+        entry = {field: record[field] for field in INDEX_FIELDS if field in record}
+        # Miniature solo qui, non in library.json: gli URL si ricavano dall'hash della foto
+        thumbnails = thumbs.urls(record.get("imageUrl"))
+        if "jpg" in thumbnails:
+            entry["thumbnailUrl"] = thumbnails["jpg"][str(SIZES[0])]
+            entry["thumbnails"] = thumbnails
+        # L'uid non cambia quando si inserisce una scheda a metà timeline: gli altri frammenti restano identici
+        entry["id"] = record["uid"]
+        entry["shard"] = shard
+        index.append(entry)
+        shards.setdefault(shard, {})[record["uid"]] = record.get("bio", "")
+
+    # Patch per versione e snapshot per la sincronizzazione incrementale (dist/patches)
+    library_version = build_patches(library)
+
+    manifest = {"shardBy": shard_by, "records": len(library), "libraryVersion": library_version, "files": {}}
+    publish("index.json", minify(index), manifest)
+    for shard, bios in shards.items():
+        publish(f"bios/{shard}.json", minify(bios), manifest)
+    # Indice di ricerca su nomi, cause e biografie: gli id sono quelli di index.json
+    publish(SEARCH_FILE, minify(build_index(library)), manifest)
+    # Anniversari per giorno e intervalli della timeline per anno e decennio
+    publish(DATES_FILE, minify(build_date_indexes(library)), manifest)
+
+    # I frammenti che non esistono più vanno rimossi, altrimenti i client li scaricherebbero ancora
+    bios_dir = os.path.join(DIST_DIR, "bios")
+    for filename in os.listdir(bios_dir) if os.path.isdir(bios_dir) else []:
+        base = filename.split(".json")[0]
+        if f"bios/{base}.json" not in manifest["files"]:
+            os.remove(os.path.join(bios_dir, filename))
+
+    # La versione dipende solo dal contenuto: se nulla cambia, il manifesto resta identico
+    hashes = "".join(f"{name}:{entry['sha256']}" for name, entry in sorted(manifest["files"].items()))
+    manifest["version"] = hashlib.sha256(hashes.encode("utf-8")).hexdigest()[:16]
+
+    manifest_path = os.path.join(DIST_DIR, "manifest.json")
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            try: previous = json.load(f)
+            except: pass
+    if previous.get("version") == manifest["version"]:
+        print("📦 Distribuzione già aggiornata, nessuna modifica.")
+        return manifest
+    manifest["generatedAt"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    write_if_changed(manifest_path, json.dumps(manifest, indent=2, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+
+    total = sum(entry["gzipBytes"] for entry in manifest["files"].values())
+    print(f"📦 Distribuzione {manifest['version']}: {len(library)} schede, {len(shards)} frammenti, {total} byte gzip in totale.")
+    return manifest
+
+
+if __name__ == "__main__":
+    build_distribution("year" if "--by-year" in sys.argv else "decade")
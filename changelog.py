@@ -0,0 +1,135 @@
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+# Registro versionato delle modifiche alla biblioteca: una riga per versione, con le
+# aggiunte, gli aggiornamenti e le eliminazioni di ogni scheda (uid stabile, più lo slug inglese
+# come chiave per i client che ancora la usano).
+# L'App può così chiedere "cosa è cambiato dalla versione X" invece di riscaricare tutto.
+CHANGELOG_FILE = "changes/changelog.jsonl"
+PATCHES_DIR = "dist/patches"
+# Quante versioni tenere come patch singole: chi è più indietro riparte dallo snapshot
+KEEP_PATCHES = 200
+SNAPSHOT_FILE = "snapshot.json"
+
+
+def read_versions(path=CHANGELOG_FILE):
+    if not os.path.exists(path):
+        return []
+    versions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                versions.append(json.loads(line))
+    return versions
+
+
+def last_entry(path=CHANGELOG_FILE):
+    # Legge solo la coda del file: l'ultima riga contiene la versione più recente
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        block = min(size, 65536)
+        while True:
+            f.seek(size - block)
+            lines = f.read(block).splitlines()
+            if len(lines) > 1 or block == size:
+                break
+            block = min(size, block * 2)
+    return json.loads(lines[-1].decode("utf-8"))
+
+
+def current_version(path=CHANGELOG_FILE):
+    entry = last_entry(path)
+    return entry["version"] if entry else 0
+
+
+def append_version(changes, path=CHANGELOG_FILE):
+    """Registra un gruppo di modifiche come nuova versione e ne restituisce il numero."""
+    if not changes:
+        return current_version(path)
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    version = current_version(path) + 1
+    entry = {
+        "version": version,
+        "at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "changes": changes,
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return version
+
+
+def write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def snapshot_version(out_dir=PATCHES_DIR):
+    # La versione dello snapshot pubblicato è nell'indice: non serve rileggere tutta la biblioteca
+    index_path = os.path.join(out_dir, "index.json")
+    if not os.path.exists(os.path.join(out_dir, SNAPSHOT_FILE)) or not os.path.exists(index_path):
+        return None
+    with open(index_path, "r", encoding="utf-8") as f:
+        try: return json.load(f).get("snapshot")
+        except: return None
+
+
+def build_patches(library, out_dir=PATCHES_DIR, path=CHANGELOG_FILE, keep=KEEP_PATCHES, snapshot=False):
+    """
+    Genera una patch per ciascuna delle ultime `keep` versioni e un indice delle patch disponibili.
+    Lo snapshot compatto della biblioteca si riscrive solo quando serve: se manca, se le patch
+    tenute non partono più dalla sua versione (chi lo scarica non potrebbe aggiornarsi) o con `snapshot`.
+    `library` deve essere alla versione corrente del registro.
+    """
+    versions = read_versions(path)
+    latest = versions[-1]["version"] if versions else 0
+    kept = versions[-keep:]
+    os.makedirs(out_dir, exist_ok=True)
+
+    wanted = set()
+    for entry in kept:
+        filename = f"v{entry['version']}.json"
+        wanted.add(filename)
+        patch_path = os.path.join(out_dir, filename)
+        # Una patch pubblicata non cambia più: si scrive solo la prima volta
+        if not os.path.exists(patch_path):
+            write_json(patch_path, entry)
+    for filename in os.listdir(out_dir):
+        if filename.startswith("v") and filename not in wanted:
+            os.remove(os.path.join(out_dir, filename))
+
+    oldest = kept[0]["version"] if kept else latest
+    current = snapshot_version(out_dir)
+    if snapshot or current is None or current < oldest - 1 or current > latest:
+        write_json(os.path.join(out_dir, SNAPSHOT_FILE), {"version": latest, "records": library})
+        current = latest
+    write_json(os.path.join(out_dir, "index.json"), {
+        "latest": latest,
+        "oldest": oldest,
+        "versions": [entry["version"] for entry in kept],
+        # Chi parte dallo snapshot applica poi le patch successive a questa versione
+        "snapshot": current,
+    })
+    return latest
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        from library_store import LibraryStore
+        latest = build_patches(LibraryStore().to_list())
+        print(f"🧩 Patch generate fino alla versione {latest}.")
+    elif len(sys.argv) > 1 and sys.argv[1] == "snapshot":
+        # Snapshot su richiesta, per esempio dopo una correzione manuale di library.json
+        from library_store import LibraryStore
+        latest = build_patches(LibraryStore().to_list(), snapshot=True)
+        print(f"🧩 Snapshot della biblioteca alla versione {latest}.")
+    else:
+        print(f"Versione corrente della biblioteca: {current_version()}")
@@ -0,0 +1,168 @@
+import bisect
+import calendar
+import re
+import sys
+
+# Date della biblioteca: stringhe ISO con anno astronomico con segno ("-0034-05-11" è il 35 a.C.),
+# a volte parziali ("1991", "1991-11") o con mese e giorno a 00 come nel dump di Wikidata.
+# "1000-01-01" è il segnaposto di fetch_wikidata_dates quando la nascita non è nota.
+# Qui si leggono tutte allo stesso modo e si costruiscono gli indici precalcolati
+# (anniversari per giorno dell'anno, anni e decenni come intervalli della timeline).
+PLACEHOLDER = "1000-01-01"
+DATES_FILE = "dates.json"
+_DATE = re.compile(r"^([+-]?)(\d{1,6})(?:-(\d{1,2}))?(?:-(\d{1,2}))?(?:T.*)?$")
+# Chiave delle date mancanti o illeggibili: prima di tutte, come faceva la stringa vuota
+MISSING_KEY = (-10 ** 9, 0, 0)
+
+
+def parse_date(value):
+    """
+    (anno, mese, giorno) con mese e giorno None se non noti; None per date vuote o illeggibili.
+    "-0034-05-11" -> (-34, 5, 11), "1991-00-00" -> (1991, None, None), "1991-11" -> (1991, 11, None).
+    """
+    match = _DATE.match(value.strip()) if isinstance(value, str) else None
+    if not match:
+        return None
+    sign, year, month, day = match.groups()
+    year = -int(year) if sign == "-" else int(year)
+    month = int(month) if month and 1 <= int(month) <= 12 else None
+    day = int(day) if day and month and 1 <= int(day) <= 31 else None
+    return year, month, day
+
+
+def is_placeholder(value):
+    return value == PLACEHOLDER
+
+
+def sort_key(value):
+    """
+    Chiave cronologica: a differenza del confronto tra stringhe, "-0500" viene prima di "-0034".
+    Le parti mancanti contano come inizio dell'anno o del mese.
+    """
+    parsed = parse_date(value)
+    if parsed is None:
+        return MISSING_KEY
+    year, month, day = parsed
+    return year, month or 0, day or 0
+
+
+def year_of(value):
+    parsed = parse_date(value)
+    return parsed[0] if parsed else None
+
+
+def decade_of(year):
+    # Come i frammenti di build_distribution: il 35 a.C. (-34) sta negli anni "-40"
+    return year // 10 * 10
+
+
+def month_day(value):
+    """"05-11" per gli anniversari; None se il giorno non è noto o la data è il segnaposto."""
+    if is_placeholder(value):
+        return None
+    parsed = parse_date(value)
+    if not parsed or parsed[1] is None or parsed[2] is None:
+        return None
+    return f"{parsed[1]:02d}-{parsed[2]:02d}"
+
+
+def normalize_date(value):
+    """Forma canonica ("-0034-05-11", "1991-11", "1991"); None per segnaposto, date vuote o illeggibili."""
+    if is_placeholder(value):
+        return None
+    parsed = parse_date(value)
+    if not parsed:
+        return None
+    year, month, day = parsed
+    text = f"-{-year:04d}" if year < 0 else f"{year:04d}"
+    if month:
+        text += f"-{month:02d}"
+        if day:
+            text += f"-{day:02d}"
+    return text
+
+
+def build_date_indexes(library):
+    """
+    Indici per la biblioteca già ordinata per data di morte (gli id sono gli uid, come in
+    dist/index.json):
+      deaths / births: "MM-GG" -> uid delle schede con quell'anniversario
+      timeline: gli uid nell'ordine della timeline
+      years / decades: anno -> [inizio, fine) in "timeline", senza dover scorrere le schede
+    """
+    deaths, births, years, decades = {}, {}, {}, {}
+    for position, record in enumerate(library):
+        for field, index in (("deathDate", deaths), ("birthDate", births)):
+            key = month_day(record.get(field))
+            if key:
+                index.setdefault(key, []).append(record["uid"])
+        year = year_of(record.get("deathDate"))
+        if year is None:
+            continue
+        for buckets, bucket in ((years, year), (decades, decade_of(year))):
+            span = buckets.setdefault(str(bucket), [position, position + 1])
+            span[1] = position + 1
+    return {
+        "deaths": dict(sorted(deaths.items())),
+        "births": dict(sorted(births.items())),
+        "timeline": [record["uid"] for record in library],
+        "years": years,
+        "decades": decades,
+    }
+
+
+class DateIndex:
+    """Risposte immediate per il calendario e la timeline a partire dagli indici precalcolati."""
+
+    def __init__(self, data):
+        self.data = data
+        # Anni ordinati per le ricerche su un intervallo qualsiasi
+        self.years = sorted((int(year), span) for year, span in data["years"].items())
+        self.year_keys = [year for year, _ in self.years]
+
+    def on_this_day(self, month, day, kind="deaths", year=None):
+        """Uid delle schede con l'anniversario in quel giorno; negli anni non bisestili il 28/2 include il 29/2."""
+        ids = list(self.data[kind].get(f"{month:02d}-{day:02d}", []))
+        if year is not None and (month, day) == (2, 28) and not calendar.isleap(year):
+            ids += self.data[kind].get("02-29", [])
+        return ids
+
+    def ids(self, span):
+        # Uid delle schede in un intervallo [inizio, fine) della timeline
+        return self.data["timeline"][span[0]:span[1]] if span else []
+
+    def year_range(self, year):
+        # [inizio, fine) nella timeline, oppure None se nessuno è morto quell'anno
+        span = self.data["years"].get(str(year))
+        return tuple(span) if span else None
+
+    def decade_range(self, decade):
+        span = self.data["decades"].get(str(decade_of(decade)))
+        return tuple(span) if span else None
+
+    def timeline_range(self, start_year, end_year):
+        """[inizio, fine) delle schede morte tra start_year ed end_year compresi."""
+        lo = bisect.bisect_left(self.year_keys, start_year)
+        hi = bisect.bisect_right(self.year_keys, end_year)
+        if lo >= hi:
+            return None
+        return self.years[lo][1][0], self.years[hi - 1][1][1]
+
+
+if __name__ == "__main__":
+    # python dates.py today | 05-11 | 1991 | 1990s
+    import json
+    from datetime import date
+    from library_store import LibraryStore
+    library = LibraryStore().to_list()
+    index = DateIndex(build_date_indexes(library))
+    records = {record["uid"]: record for record in library}
+    arg = sys.argv[1] if len(sys.argv) > 1 else "today"
+    if arg == "today" or re.match(r"^\d{2}-\d{2}$", arg):
+        month, day = (date.today().month, date.today().day) if arg == "today" else map(int, arg.split("-"))
+        ids = index.on_this_day(month, day, year=date.today().year)
+    elif arg.endswith("s"):
+        ids = index.ids(index.decade_range(int(arg[:-1])))
+    else:
+        ids = index.ids(index.year_range(int(arg)))
+    print(json.dumps([f"{records[i]['name']} ({records[i].get('deathDate')})" for i in ids], ensure_ascii=False, indent=2))
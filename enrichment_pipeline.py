@@ -0,0 +1,392 @@
+import sys
+import time
+
+import http_client
+import image_pipeline
+import metrics
+from enrichment_state import Checkpoint, EnrichmentLedger
+from fetch_engine import parallel_map
+from library_store import LibraryStore
+from summary_cache import SummaryUnavailable, fetch_summary, peek_summary
+from wikidata_batch import resolve_slugs
+
+JSON_FILE = "library.json"
+
+HEADERS = {
+    'User-Agent': 'iMissYouApp_Enricher/1.0 (https://github.com/Gimmons1)',
+    'Accept': 'application/json'
+}
+
+# Attività selezionabili da riga di comando: biografia, causa del decesso, immagine, miniature
+TASKS = ["bio", "cause", "image", "thumbs"]
+# Lingue del riassunto che servono a ciascuna attività (l'ordine conta: a parità vince la prima)
+BIO_LANGUAGES = ["it", "en", "fr", "es"]
+IMAGE_LANGUAGES = ["en", "it"]
+SHORT_BIO = 150
+# Ogni quante schede si mettono al sicuro i progressi (multiplo dei blocchi SPARQL da 50)
+CHECKPOINT_EVERY = 100
+
+
+def summary_slug(slugs, lang):
+    # Cerca lo slug specifico della lingua, se non c'è usa EN o IT come fallback
+    return slugs.get(lang.upper(), slugs.get("EN", slugs.get("IT", "")))
+
+
+def cause_lookup_slug(person):
+    # Usa lo slug inglese (più preciso su Wikidata) o quello italiano come riserva
+    slugs = person.get("slugs", {})
+    return slugs.get("EN", "") or slugs.get("IT", "")
+
+
+def known_revision(person):
+    # Revisione della pagina inglese già presente in cache: se cambia, la scheda va ricontrollata
+    slug = cause_lookup_slug(person)
+    data = peek_summary(slug, "en") if slug else None
+    return str(data["revision"]) if data and data.get("revision") else None
+
+
+class Job:
+    """Una scheda che attraversa la pipeline, con i dati scaricati una volta e condivisi tra le fasi."""
+
+    def __init__(self, rid, person, tasks, revision=None):
+        self.rid = rid
+        self.person = person
+        self.tasks = tasks
+        self.revision = revision
+        self.summaries = {}
+        self.bio = None
+        self.image = None
+        self.cause = None
+        self.failed = set()
+        self.thumbs = None
+
+
+def plan(items, tasks, ledger, thumbs):
+    """Sceglie le schede da elaborare: solo quelle che hanno qualcosa da sistemare e sono in scadenza."""
+    jobs = []
+    for rid, person in items:
+        bio = person.get("bio", "")
+        revision = known_revision(person)
+        needed = set()
+        if "bio" in tasks and len(bio) < SHORT_BIO and ledger.is_due(person, "bio", revision):
+            needed.add("bio")
+        if "cause" in tasks and "Causa del decesso:" not in bio and cause_lookup_slug(person) and ledger.is_due(person, "cause", revision):
+            needed.add("cause")
+        if "image" in tasks and not person.get("imageUrl") and ledger.is_due(person, "image", revision):
+            needed.add("image")
+        if "thumbs" in tasks and needs_thumbnails(person, needed, ledger, thumbs):
+            needed.add("thumbs")
+        if needed:
+            jobs.append(Job(rid, person, needed, revision))
+    return jobs
+
+
+def needs_thumbnails(person, needed, ledger, thumbs):
+    if not image_pipeline.available():
+        return False
+    if "image" in needed:
+        return True
+    if not person.get("imageUrl"):
+        return False
+    # Foto nuova o cambiata a mano; altrimenti si ricontrolla l'ETag della sorgente ogni tanto
+    return thumbs.get(person["imageUrl"]) is None or ledger.is_due(person, "thumbs")
+
+
+# --- Fase 1: riassunti Wikipedia (una sola richiesta per lingua, riusata da bio e immagine) ---
+
+def stage_summary(job):
+    slugs = job.person.get("slugs", {})
+    languages = []
+    if "bio" in job.tasks:
+        languages += BIO_LANGUAGES
+    if "image" in job.tasks:
+        languages += [lang for lang in IMAGE_LANGUAGES if lang not in languages]
+
+    unavailable = set()
+
+    def fetch(lang):
+        slug = summary_slug(slugs, lang)
+        try:
+            return fetch_summary(slug, lang, headers=HEADERS, timeout=5) if slug else None
+        except SummaryUnavailable:
+            unavailable.add(lang)
+            return None
+
+    for lang, data in zip(languages, parallel_map(fetch, languages, max_workers=len(languages) or 1)):
+        job.summaries[lang] = data
+    # Una lingua non arrivata per un errore di rete rende l'esito un errore, non un "mancante"
+    if "bio" in job.tasks and unavailable & set(BIO_LANGUAGES):
+        job.failed.add("bio")
+    if "image" in job.tasks and unavailable & set(IMAGE_LANGUAGES):
+        job.failed.add("image")
+
+
+# --- Fase 2: scelta della biografia migliore ---
+
+def stage_bio(job):
+    if "bio" not in job.tasks:
+        return
+    print(f"Biografia di {job.person['name']} troppo corta ({len(job.person.get('bio', ''))} caratteri). Cerco alternative...")
+    best_bio = ""
+    for lang in BIO_LANGUAGES:
+        data = job.summaries.get(lang)
+        extract = data.get("extract", "") if data else ""
+        if len(extract) > len(best_bio):
+            best_bio = extract
+    job.bio = best_bio
+
+
+# --- Fase 3: scelta dell'immagine (Wikipedia inglese, poi italiana) ---
+
+def stage_image(job):
+    if "image" not in job.tasks:
+        return
+    print(f"Cerco foto ad alta affidabilità per: {job.person['name']}...")
+    slugs = job.person.get("slugs", {})
+    for lang in IMAGE_LANGUAGES:
+        # Per l'immagine si usa solo lo slug della lingua, senza ripieghi
+        data = job.summaries.get(lang) if slugs.get(lang.upper()) else None
+        if data and "originalimage" in data:
+            job.image = data["originalimage"]["source"]
+            return
+
+
+# --- Fase 4: fatti da Wikidata, a blocchi per tutte le schede insieme ---
+
+def stage_facts(jobs):
+    cause_jobs = [job for job in jobs if "cause" in job.tasks]
+    image_jobs = [job for job in jobs if "image" in job.tasks and not job.image and job.person.get("slugs", {}).get("IT")]
+
+    if cause_jobs:
+        failed = set()
+        resolved = resolve_slugs([cause_lookup_slug(job.person) for job in cause_jobs], lang="en", failed=failed)
+        for job in cause_jobs:
+            slug = cause_lookup_slug(job.person)
+            job.cause = resolved.get(slug, {}).get("cause")
+            if slug in failed: job.failed.add("cause")
+
+    if image_jobs:
+        # Ricerca estrema direttamente sul server centrale globale (Wikidata), per chi non ha foto su Wikipedia
+        failed = set()
+        resolved = resolve_slugs([job.person["slugs"]["IT"] for job in image_jobs], lang="it", failed=failed)
+        for job in image_jobs:
+            slug = job.person["slugs"]["IT"]
+            job.image = resolved.get(slug, {}).get("image")
+            if slug in failed: job.failed.add("image")
+
+
+# --- Fase 5: miniature della foto (dopo i fatti, così vale anche per le immagini trovate su Wikidata) ---
+
+def stage_thumbs(job, ledger, thumbs):
+    url = job.image or job.person.get("imageUrl")
+    if "thumbs" not in job.tasks or not url:
+        return job
+    etag = None
+    if thumbs.get(url):
+        # La sorgente è la stessa dell'ultima volta: basta chiedere se è cambiata
+        etag = (ledger.get(job.person, "thumbs") or {}).get("revision")
+    job.thumbs = (url,) + image_pipeline.make_thumbnails(url, etag)
+    return job
+
+
+# --- Fase 6: fusione nella scheda e nel registro ---
+
+def outcome(job, task, found):
+    return "found" if found else ("error" if task in job.failed else "missing")
+
+
+def stage_merge(job, store, ledger, thumbs):
+    """Applica alla scheda i risultati delle fasi precedenti; restituisce le attività andate a buon fine."""
+    person = job.person
+    fields = {}
+    done = set()
+    current_bio = person.get("bio", "")
+
+    if "bio" in job.tasks:
+        new_bio = job.bio
+        improved = bool(new_bio) and len(new_bio) > len(current_bio)
+        if improved:
+            # Se c'era già la causa di morte, la manteniamo in cima
+            if "⚕️ Causa del decesso:" in current_bio:
+                causa_esistente = current_bio.split("\n\n")[0]
+                current_bio = f"{causa_esistente}\n\n{new_bio}"
+            else:
+                current_bio = new_bio
+            fields["bio"] = current_bio
+            done.add("bio")
+            print(f" -> ✅ Biografia arricchita per {person['name']}!")
+        ledger.record(person, "bio", outcome(job, "bio", improved), job.revision)
+
+    if "cause" in job.tasks:
+        if job.cause and "Causa del decesso:" not in current_bio:
+            # Formatta la causa con la prima lettera maiuscola e la inserisce in cima alla biografia
+            formatted_cause = job.cause[0].upper() + job.cause[1:]
+            fields["bio"] = f"⚕️ Causa del decesso: {formatted_cause}.\n\n{current_bio}"
+            done.add("cause")
+            print(f" -> ⚕️ Trovata causa di morte per {person['name']}: {formatted_cause}")
+        ledger.record(person, "cause", outcome(job, "cause", job.cause), job.revision)
+
+    if "image" in job.tasks:
+        if job.image:
+            fields["imageUrl"] = job.image
+            done.add("image")
+            print(f" -> ✅ Trovata e riparata per {person['name']}: {job.image}")
+        ledger.record(person, "image", outcome(job, "image", job.image), job.revision)
+
+    if "thumbs" in job.tasks and job.thumbs:
+        url, status, digest, etag = job.thumbs
+        # Le miniature restano fuori dalla scheda: l'indice delle miniature ricorda solo l'hash
+        if status == "ok" and thumbs.set(url, digest):
+            done.add("thumbs")
+        # Per le miniature la "revisione" è l'ETag della foto sorgente
+        ledger.record(person, "thumbs", "found" if status in ("ok", "same") else status, etag)
+
+    if fields:
+        store.update(job.rid, **fields)
+    return done
+
+
+def process_batch(jobs, tasks, store, ledger, counts, thumbs):
+    """Porta un blocco di schede attraverso tutte le fasi, fino alla fusione nella biblioteca."""
+    def per_record(job):
+        # Tempi per scheda: "volte" è il numero di schede, "max" la scheda più lenta
+        with metrics.timer("fase.riassunti"):
+            stage_summary(job)
+        stage_bio(job)
+        stage_image(job)
+        return job
+
+    jobs = parallel_map(per_record, jobs)
+    with metrics.timer("fase.fatti_wikidata"):
+        stage_facts(jobs)
+    if "thumbs" in tasks:
+        def timed_thumbs(job):
+            with metrics.timer("fase.miniature"):
+                return stage_thumbs(job, ledger, thumbs)
+        jobs = parallel_map(timed_thumbs, jobs)
+
+    # La fusione avviene in un solo thread: la biblioteca e i suoi indici non sono condivisi
+    with metrics.timer("fase.fusione"):
+        for job in jobs:
+            for task in stage_merge(job, store, ledger, thumbs):
+                counts[task] += 1
+
+
+def flush(store, ledger, checkpoint, thumbs):
+    # Diario della biblioteca, registro, miniature e cursore: se il processo muore qui, nulla di fatto va perso
+    with metrics.timer("fase.checkpoint"):
+        store.save()
+        ledger.save()
+        thumbs.save()
+        checkpoint.save()
+
+
+def run_pipeline(tasks=TASKS, time_budget=None):
+    """
+    Arricchisce la biblioteca in un solo passaggio: ogni scheda attraversa le fasi
+    riassunto -> biografia -> immagine -> fatti Wikidata -> miniature -> fusione, e ogni risposta
+    scaricata viene riusata da tutte le fasi che ne hanno bisogno.
+    Le schede vanno a blocchi di CHECKPOINT_EVERY: dopo ogni blocco i progressi finiscono nel
+    diario della biblioteca, nel registro e nel cursore, e la passata successiva riparte da lì.
+    Con `time_budget` (secondi) ci si ferma prima di un blocco che non farebbe in tempo a finire.
+    Restituisce il numero di schede modificate per ciascuna attività.
+    """
+    started = time.monotonic()
+    print(f"Avvio pipeline di arricchimento ({', '.join(tasks)})...")
+    if "thumbs" in tasks and not image_pipeline.available():
+        print("Pillow non installato: le miniature non verranno generate.")
+    with metrics.timer("fase.caricamento"):
+        store = LibraryStore(JSON_FILE)
+    if not len(store):
+        print("Database non trovato o illeggibile.")
+        return {}
+
+    # Il registro evita di richiedere ogni volta ciò che Wikidata e Wikipedia non hanno
+    ledger = EnrichmentLedger()
+    checkpoint = Checkpoint(tasks)
+    thumbs = image_pipeline.ThumbnailIndex()
+    with metrics.timer("fase.pianificazione"):
+        items = store.items()
+        jobs = plan(items, set(tasks), ledger, thumbs)
+        if checkpoint.cursor:
+            jobs = checkpoint.resume(jobs, items)
+            print(f"Ripresa della passata precedente dopo {checkpoint.label}.")
+    print(f"Schede da elaborare: {len(jobs)} su {len(store)}")
+    metrics.set_value("schede esaminate", len(store))
+    metrics.set_value("schede da elaborare", len(jobs))
+
+    counts = {task: 0 for task in tasks}
+    processed = 0
+    slowest = 0.0
+    try:
+        for start in range(0, len(jobs), CHECKPOINT_EVERY):
+            # Il blocco più lento visto finora fa da stima: meglio fermarsi un blocco prima
+            if time_budget and time.monotonic() - started + slowest > time_budget:
+                print(f"\n⏳ Tempo a disposizione quasi finito: mi fermo dopo {processed} schede su {len(jobs)}.")
+                break
+            began = time.monotonic()
+            batch = jobs[start:start + CHECKPOINT_EVERY]
+            process_batch(batch, tasks, store, ledger, counts, thumbs)
+            processed += len(batch)
+            checkpoint.advance(batch[-1].person, len(batch))
+            flush(store, ledger, checkpoint, thumbs)
+            slowest = max(slowest, time.monotonic() - began)
+    except KeyboardInterrupt:
+        # Annullamento del runner: si salva quanto fatto finora, il blocco a metà verrà ripetuto
+        print(f"\n⏹️ Interrotto: salvo i progressi ({processed} schede su {len(jobs)}).")
+
+    if processed == len(jobs):
+        checkpoint.finish()
+    metrics.set_value("schede elaborate", processed)
+    with metrics.timer("fase.checkpoint"):
+        checkpoint.save()
+        ledger.save(store.to_list())
+        if "thumbs" in tasks:
+            thumbs.save(store.to_list())
+        store.save()
+
+    # Contano anche le schede salvate nel diario da una passata interrotta e non ancora compattate
+    changed = len(store.touched | store.removed)
+    metrics.set_value("schede modificate", changed)
+    for task, count in counts.items():
+        metrics.set_value(f"schede modificate ({task})", count)
+    if changed:
+        with metrics.timer("fase.salvataggio"):
+            store.commit()
+        print(f"\n✅ Operazione conclusa! {changed} profili aggiornati ({', '.join(f'{t}: {n}' for t, n in counts.items())}).")
+    else:
+        print("\nTutte le schede sono già perfette. Nessun aggiornamento necessario.")
+    if processed < len(jobs):
+        print(f"🔖 Restano {len(jobs) - processed} schede: la prossima esecuzione riprende da {checkpoint.label}.")
+    http_client.print_failure_report()
+    return counts
+
+
+def parse_tasks(argv):
+    # python enrichment_pipeline.py --stages bio,cause,image
+    if "--stages" in argv and argv.index("--stages") + 1 < len(argv):
+        chosen = [t.strip() for t in argv[argv.index("--stages") + 1].split(",") if t.strip()]
+        unknown = [t for t in chosen if t not in TASKS]
+        if unknown:
+            sys.exit(f"Attività sconosciute: {', '.join(unknown)} (disponibili: {', '.join(TASKS)})")
+        return chosen
+    return TASKS
+
+
+def parse_time_budget(argv):
+    # --time-budget 45m (anche 2h, 90s o semplici secondi): va lasciato margine sul limite del runner
+    if "--time-budget" not in argv or argv.index("--time-budget") + 1 >= len(argv):
+        return None
+    raw = argv[argv.index("--time-budget") + 1].strip().lower()
+    units = {"s": 1, "m": 60, "h": 3600}
+    try:
+        if raw[-1:] in units:
+            return float(raw[:-1]) * units[raw[-1]]
+        return float(raw)
+    except ValueError:
+        sys.exit(f"Tempo non valido per --time-budget: {raw} (esempi: 45m, 2h, 600)")
+
+
+if __name__ == "__main__":
+    metrics.start_run("enrichment_pipeline")
+    run_pipeline(parse_tasks(sys.argv), parse_time_budget(sys.argv))
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from library_store import record_key
+
+# Registro degli arricchimenti tentati, salvato accanto a library.json.
+# Per ogni scheda (per uid) e per ogni attività (bio, causa, immagine) ricorda quando è stata tentata,
+# com'è andata e quale revisione della pagina Wikipedia era stata vista.
+STATE_FILE = "enrichment_state.json"
+
+# Prima riprova dopo un giorno, poi 2, 4, 8... fino a un massimo di 90 giorni
+BASE_RETRY = 24 * 3600
+MAX_RETRY = 90 * 24 * 3600
+# Gli errori di rete non dicono nulla sul dato: si riprova presto
+ERROR_RETRY = 3600
+
+
+def slugs_fingerprint(person):
+    # Se un admin corregge gli slug la scheda va ricontrollata anche se era in pausa
+    slugs = person.get("slugs", {})
+    raw = json.dumps(slugs, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def entry_key(person):
+    # L'uid distingue anche le schede con lo stesso slug; record_key resta per quelle che non l'hanno
+    return person.get("uid") or record_key(person)
+
+
+def retry_delay(attempts):
+    return min(BASE_RETRY * (2 ** max(attempts - 1, 0)), MAX_RETRY)
+
+
+class EnrichmentLedger:
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                try: self.entries = json.load(f)
+                except: self.entries = {}
+
+    def tasks(self, person):
+        # Le voci salvate prima degli uid sono per slug: valgono finché la scheda non ha la sua
+        entry = self.entries.get(entry_key(person))
+        return entry if entry is not None else self.entries.get(record_key(person), {})
+
+    def get(self, person, task):
+        return self.tasks(person).get(task)
+
+    def is_due(self, person, task, revision=None, now=None):
+        """
+        Una scheda va (ri)elaborata se è nuova, se gli slug o la revisione Wikipedia sono cambiati,
+        oppure se è passato abbastanza tempo dall'ultimo tentativo fallito (backoff esponenziale).
+        """
+        entry = self.get(person, task)
+        if not entry:
+            return True
+        if entry.get("slugs") != slugs_fingerprint(person):
+            return True
+        if revision and entry.get("revision") and revision != entry["revision"]:
+            return True
+        now = now or time.time()
+        if entry["outcome"] == "error":
+            return now >= entry["last_attempt"] + ERROR_RETRY
+        return now >= entry["last_attempt"] + retry_delay(entry.get("attempts", 1))
+
+    def record(self, person, task, outcome, revision=None):
+        key = entry_key(person)
+        with self.lock:
+            entry = self.entries.setdefault(key, dict(self.tasks(person)))
+            previous = entry.get(task, {})
+            # Un risultato nuovo o una revisione diversa fanno ripartire il conteggio del backoff
+            same_result = previous.get("outcome") == outcome and previous.get("revision") == revision
+            entry[task] = {
+                "last_attempt": int(time.time()),
+                "outcome": outcome,
+                "attempts": previous.get("attempts", 0) + 1 if same_result else 1,
+                "revision": revision,
+                "slugs": slugs_fingerprint(person),
+            }
+
+    def save(self, library=None):
+        with self.lock:
+            if library is not None:
+                # Le voci per slug passano all'uid di ogni scheda che le usava, poi si dimenticano
+                # le schede che non esistono più nella biblioteca
+                for person in library:
+                    key = entry_key(person)
+                    if key not in self.entries and record_key(person) in self.entries:
+                        self.entries[key] = dict(self.entries[record_key(person)])
+                alive = {entry_key(p) for p in library}
+                self.entries = {k: v for k, v in self.entries.items() if k in alive}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2, ensure_ascii=False, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+# Cursore delle passate di arricchimento, salvato accanto al registro. Una passata lunga
+# interrotta (tempo a disposizione finito, runner annullato) riprende dalla scheda successiva.
+CHECKPOINT_FILE = "enrichment_checkpoint.json"
+
+
+class Checkpoint:
+    """
+    Un cursore per ogni combinazione di attività (bio_updater e auto_fixer hanno passate distinte):
+    l'uid dell'ultima scheda elaborata e quante schede ha già fatto la passata in corso.
+    """
+
+    def __init__(self, tasks, path=CHECKPOINT_FILE):
+        self.path = path
+        self.key = ",".join(sorted(tasks))
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                try: self.entries = json.load(f)
+                except: self.entries = {}
+
+    @property
+    def cursor(self):
+        return self.entries.get(self.key, {}).get("cursor")
+
+    @property
+    def label(self):
+        # Il nome è solo per i messaggi: il cursore vero è l'uid
+        return self.entries.get(self.key, {}).get("name") or self.cursor
+
+    def resume(self, jobs, items):
+        """
+        Riordina le schede (già in ordine di timeline) perché la passata riparta dopo il cursore;
+        quelle prima del cursore vengono in coda. `items` sono le coppie (id, scheda) della timeline.
+        """
+        positions = {}
+        for i, (_, person) in enumerate(items):
+            positions[entry_key(person)] = i
+            # Un cursore salvato prima degli uid è uno slug
+            positions.setdefault(record_key(person), i)
+        position = positions.get(self.cursor)
+        if position is None:
+            return jobs
+        split = next((i for i, job in enumerate(jobs) if positions[entry_key(job.person)] > position), len(jobs))
+        return jobs[split:] + jobs[:split]
+
+    def advance(self, person, count):
+        entry = self.entries.setdefault(self.key, {"started": int(time.time()), "done": 0})
+        entry["cursor"] = entry_key(person)
+        entry["name"] = person.get("name")
+        entry["done"] += count
+        entry["updated"] = int(time.time())
+
+    def finish(self):
+        # Passata completa: la prossima ricomincia dall'inizio della timeline
+        self.entries.pop(self.key, None)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+# Numero massimo di richieste contemporanee per gli script che elaborano tutta la biblioteca
+MAX_WORKERS = 8
+
+# Limiti per gruppo di host: (richieste al secondo, raffica massima).
+# Wikidata è molto più severo di Wikipedia con le query SPARQL, quindi viaggia più piano.
+HOST_LIMITS = {
+    "wikipedia.org": (10.0, 10),
+    "query.wikidata.org": (5.0, 5),
+    # Foto originali e ridimensionate (upload.wikimedia.org, commons.wikimedia.org)
+    "wikimedia.org": (10.0, 10),
+}
+DEFAULT_LIMIT = (5.0, 5)
+# Solo per i benchmark contro il server finto: moltiplica tutte le velocità consentite
+RATE_SCALE = float(os.environ.get("FETCH_RATE_SCALE", 1))
+# Host (con porta) che fanno le veci di un gruppo, per esempio il server finto di bench_server.py
+HOST_ALIASES = {}
+
+
+class TokenBucket:
+    """Secchio di gettoni thread-safe: ogni richiesta consuma un gettone, che si ricarica a `rate` al secondo."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def host_group(url):
+    """Raggruppa gli host: tutte le edizioni linguistiche di Wikipedia condividono lo stesso secchio."""
+    parsed = urlparse(url)
+    if parsed.netloc in HOST_ALIASES:
+        return HOST_ALIASES[parsed.netloc]
+    host = parsed.hostname or ""
+    for group in HOST_LIMITS:
+        if host == group or host.endswith("." + group):
+            return group
+    return host
+
+
+def register_alias(url, group):
+    HOST_ALIASES[urlparse(url).netloc] = group
+
+
+def limiter_for(url):
+    group = host_group(url)
+    with _buckets_lock:
+        if group not in _buckets:
+            rate, capacity = HOST_LIMITS.get(group, DEFAULT_LIMIT)
+            _buckets[group] = TokenBucket(rate * RATE_SCALE, max(1, int(capacity * RATE_SCALE)))
+        return _buckets[group]
+
+
+def parallel_map(func, items, max_workers=MAX_WORKERS):
+    """Applica `func` a ogni elemento in parallelo e restituisce i risultati nello stesso ordine di `items`."""
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(func, items))
@@ -1,12 +1,20 @@
-import requests
-import json
-import os
-import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+import heapq
+import sys
 import urllib.parse
 
+import http_client
+import metrics
+from dates import sort_key
+from fetch_engine import MAX_WORKERS, parallel_map
+from library_store import LibraryStore
+from name_index import NameIndex
+from summary_cache import SummaryUnavailable, fetch_summary
+from wikidata_dump import MIN_SITELINKS, iter_candidates
+
 JSON_FILE = "library.json"
-SPARQL_URL = "https://query.wikidata.org/sparql"
+SPARQL_URL = http_client.SPARQL_URL
 # Fonti certificate e affidabili
 HEADERS = {
     'User-Agent': 'iMissYouApp_Historical/9.1 (https://github.com/Gimmons1)',
@@ -24,112 +32,270 @@ EPOCHE = [
     (2020, ANNO_CORRENTE) # <- Si aggiorna da solo fino ad oggi!
 ]
 
+# Query contemporanee: Wikidata ne accetta al massimo 5 per IP, se ne lascia margine agli altri script
+SPARQL_WORKERS = 3
+# Righe per query: una fascia che le riempie tutte viene divisa in fasce più strette
+SHARD_LIMIT = 100
+SHARD_RETRIES = 1
+
+@metrics.timed("fase.biografie")
 def get_wikipedia_bio(slug, lang="it"):
-    # Usa l'URL esatto per evitare errori con spazi e caratteri strani
-    url = f"https://{lang}.wikipedia.org/api/rest_v1/page/summary/{urllib.parse.quote(slug)}"
+    # La cache condivisa usa l'URL esatto per evitare errori con spazi e caratteri strani
     try:
-        response = requests.get(url, headers=HEADERS, timeout=(5, 5))
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("titles", {}).get("canonical", slug), data.get("extract", "")
-    except:
-        pass
+        data = fetch_summary(slug, lang, headers=HEADERS, timeout=(5, 5))
+    except SummaryUnavailable:
+        # La pipeline di arricchimento riproverà sulle biografie rimaste corte
+        data = None
+    if data:
+        return data.get("titles", {}).get("canonical", slug), data.get("extract", "")
     return slug.replace('_', ' '), "Biografia recuperata dagli archivi ufficiali."
 
+def build_record(raw_name, slug_en, birth, death, img, qid=None):
+    """Costruisce la scheda della biblioteca a partire dai dati Wikidata di una persona."""
+    # RIMUOVE GLI UNDERSCORE: Il nome mostrato nell'App sarà perfetto
+    clean_name = raw_name.replace('_', ' ')
+    it_slug, bio = get_wikipedia_bio(slug_en)
+    record = {
+        "name": clean_name, 
+        "slugs": {"IT": it_slug.replace(' ', '_'), "EN": slug_en},
+        "bio": bio, 
+        "birthDate": birth, 
+        "deathDate": death, 
+        "imageUrl": img, 
+        "approved": True
+    }
+    if qid:
+        # Il QID Wikidata è l'identità certa della persona, qualunque sia il titolo della pagina
+        record["qid"] = qid
+    return record
+
+def is_duplicate(store, pending, record):
+    # Doppione se la persona è già in biblioteca o tra quelle appena trovate (QID, slug o nome normalizzati)
+    return store.find_duplicate(record) is not None or pending.find_duplicate(record) is not None
+
+def shard_label(shard):
+    start, end, month, offset = shard
+    label = f"{start}-{end}" if end != start else (f"{start}-{month:02d}" if month else str(start))
+    return label + (f" (dalla riga {offset})" if offset else "")
+
+def build_query(shard):
+    start, end, month, offset = shard
+    month_filter = f" && MONTH(?deathDate) = {month}" if month else ""
+    # ?person nell'ordinamento rende stabili le pagine quando si scorre un mese con OFFSET
+    return f"""
+    SELECT ?person ?personLabel ?birthDate ?deathDate ?image ?sitelinks ?article WHERE {{
+      ?person wdt:P31 wd:Q5. 
+      ?person wdt:P570 ?deathDate.
+      FILTER(YEAR(?deathDate) >= {start} && YEAR(?deathDate) <= {end}{month_filter})
+      ?person wikibase:sitelinks ?sitelinks .
+      FILTER(?sitelinks >= 40)
+      ?person wdt:P569 ?birthDate.
+      OPTIONAL {{ ?person wdt:P18 ?image. }}
+      OPTIONAL {{
+        ?article schema:about ?person .
+        ?article schema:isPartOf <https://en.wikipedia.org/> .
+      }}
+      SERVICE wikibase:label {{ bd:serviceParam wikibase:language "it,en". }}
+    }}
+    ORDER BY DESC(?sitelinks) ?person
+    LIMIT {SHARD_LIMIT}{f" OFFSET {offset}" if offset else ""}
+    """
+
+def split_shard(shard):
+    """Fasce più strette: un decennio diventa anni, un anno diventa mesi; un mese non si divide più."""
+    start, end, month, _ = shard
+    if end > start:
+        return [(year, year, None, 0) for year in range(start, end + 1)]
+    if month is None:
+        return [(start, start, m, 0) for m in range(1, 13)]
+    return None
+
+def fetch_shard(shard):
+    """Esegue la query di una fascia: restituisce (righe, None) oppure (None, descrizione dell'errore)."""
+    try:
+        with metrics.timer("fase.sparql"):
+            # Pochi tentativi: una query scaduta va divisa, non ripetuta identica
+            response = http_client.get(SPARQL_URL, params={'query': build_query(shard)}, headers=HEADERS,
+                                       timeout=(10, 60), max_retries=SHARD_RETRIES)
+        if response.status_code != 200:
+            return None, f"HTTP {response.status_code}"
+        return response.json()['results']['bindings'], None
+    except Exception as e:
+        return None, type(e).__name__
+
+def parse_row(item):
+    raw_name = item['personLabel']['value'].strip()
+    # Se il nome inizia con Q è un errore temporaneo del database, lo saltiamo
+    if raw_name.startswith("Q") and raw_name[1:].isdigit():
+        return None
+    # Estrae lo slug inglese pulito dall'URL per identificare la persona
+    article_url = item.get('article', {}).get('value', '')
+    slug_en = article_url.split('/')[-1] if article_url else raw_name.replace(' ', '_')
+    return {
+        "name": raw_name,
+        "slug_en": urllib.parse.unquote(slug_en),
+        "qid": item['person']['value'].rsplit('/', 1)[-1],
+        "birth": item['birthDate']['value'].split('T')[0],
+        "death": item['deathDate']['value'].split('T')[0],
+        "image": item['image']['value'] if 'image' in item else None,
+    }
+
 def run_historical_import():
+    """
+    Le epoche vengono interrogate in parallelo (al massimo SPARQL_WORKERS query alla volta).
+    Una fascia che scade o riempie il LIMIT viene divisa (decennio -> anni -> mesi, poi pagine
+    con OFFSET), così gli anni affollati sono coperti per intero. Le righe di ogni fascia passano
+    subito al controllo dei doppioni e le biografie si scaricano mentre le altre query girano.
+    """
     print(f"Avvio ricerca dinamica (fino al {ANNO_CORRENTE})...")
     
-    library = []
-    if os.path.exists(JSON_FILE):
-        with open(JSON_FILE, "r", encoding="utf-8") as f:
-            try: library = json.load(f)
-            except: pass
-
-    # FILTRO ANTI-DOPPIONI: Usa lo SLUG (ID univoco) e ignora il nome testuale
-    existing_slugs = set()
-    for p in library:
-        for val in p.get("slugs", {}).values():
-            existing_slugs.add(val.lower())
-
+    # FILTRO ANTI-DOPPIONI: Usa lo SLUG (ID univoco) e ignora il nome testuale.
+    # Lo store tiene già l'indice degli slug della biblioteca; qui si aggiungono quelli appena trovati.
+    store = LibraryStore(JSON_FILE)
+    pending = NameIndex()
+    # QID già in lavorazione: una persona con due date di morte compare in due fasce
+    queued = set()
+    skipped = []
     new_entries = []
 
-    for inizio, fine in EPOCHE:
-        print(f"\n--- Ricerca VIP: {inizio} - {fine} ---")
-        
-        query = f"""
-        SELECT ?person ?personLabel ?birthDate ?deathDate ?image ?sitelinks ?article WHERE {{
-          ?person wdt:P31 wd:Q5. 
-          ?person wdt:P570 ?deathDate.
-          FILTER(YEAR(?deathDate) >= {inizio} && YEAR(?deathDate) <= {fine})
-          ?person wikibase:sitelinks ?sitelinks .
-          FILTER(?sitelinks >= 40)
-          ?person wdt:P569 ?birthDate.
-          OPTIONAL {{ ?person wdt:P18 ?image. }}
-          OPTIONAL {{
-            ?article schema:about ?person .
-            ?article schema:isPartOf <https://en.wikipedia.org/> .
-          }}
-          SERVICE wikibase:label {{ bd:serviceParam wikibase:language "it,en". }}
-        }}
-        ORDER BY DESC(?sitelinks)
-        LIMIT 100
-        """
-        
-        for attempt in range(3):
-            try:
-                response = requests.get(SPARQL_URL, params={'query': query}, headers=HEADERS, timeout=(10, 30))
-                if response.status_code == 200:
-                    results = response.json()['results']['bindings']
-                    print(f" -> Trovate {len(results)} figure di spicco.")
-                    
-                    for item in results:
-                        raw_name = item['personLabel']['value'].strip()
-                        # Se il nome inizia con Q è un errore temporaneo del database, lo saltiamo
-                        if raw_name.startswith("Q") and raw_name[1:].isdigit(): 
-                            continue
-                            
-                        # Estrae lo slug inglese pulito dall'URL per identificare la persona
-                        article_url = item.get('article', {}).get('value', '')
-                        slug_en = article_url.split('/')[-1] if article_url else raw_name.replace(' ', '_')
-                        slug_en = urllib.parse.unquote(slug_en)
-                        
-                        if slug_en.lower() in existing_slugs:
-                            continue
-                            
-                        birth = item['birthDate']['value'].split('T')[0]
-                        death = item['deathDate']['value'].split('T')[0]
-                        img = item['image']['value'] if 'image' in item else None
-                        
-                        # RIMUOVE GLI UNDERSCORE: Il nome mostrato nell'App sarà perfetto
-                        clean_name = raw_name.replace('_', ' ')
-                        it_slug, bio = get_wikipedia_bio(slug_en)
-                        
-                        new_entries.append({
-                            "name": clean_name, 
-                            "slugs": {"IT": it_slug.replace(' ', '_'), "EN": slug_en},
-                            "bio": bio, 
-                            "birthDate": birth, 
-                            "deathDate": death, 
-                            "imageUrl": img, 
-                            "approved": True
-                        })
-                        existing_slugs.add(slug_en.lower())
-                        existing_slugs.add(it_slug.lower().replace(' ', '_'))
-                        time.sleep(0.2)
-                    break
-                else:
-                    time.sleep(5)
-            except Exception as e:
-                time.sleep(5)
+    with ThreadPoolExecutor(SPARQL_WORKERS) as queries, ThreadPoolExecutor(MAX_WORKERS) as bios:
+        running = {}
+
+        def submit_shard(shard):
+            running[queries.submit(fetch_shard, shard)] = ("shard", shard)
+
+        for inizio, fine in EPOCHE:
+            submit_shard((inizio, fine, None, 0))
 
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, shard = running.pop(future)
+                if kind == "record":
+                    # Con lo slug IT appena scoperto si riconosce anche chi era già presente col titolo italiano
+                    record = future.result()
+                    if not is_duplicate(store, pending, record):
+                        pending.add(len(new_entries), record)
+                        new_entries.append(record)
+                    continue
+
+                rows, error = future.result()
+                label = shard_label(shard)
+                full = rows is not None and len(rows) >= SHARD_LIMIT
+                # Dividere dopo un 429 moltiplicherebbe le richieste proprio quando il server chiede di rallentare
+                smaller = split_shard(shard) if (error and error != "HTTP 429") or full else None
+                if smaller:
+                    print(f" -> {label}: {error or f'limite di {SHARD_LIMIT} raggiunto'}, divido la fascia.")
+                    metrics.incr("fasce divise")
+                    for child in smaller:
+                        submit_shard(child)
+                    continue
+                if error:
+                    print(f" -> {label}: errore Wikidata ({error}), fascia saltata.")
+                    skipped.append(label)
+                    continue
+                if full:
+                    # Un mese ancora pieno: si tengono queste righe e si chiede la pagina successiva
+                    submit_shard(shard[:3] + (shard[3] + SHARD_LIMIT,))
+
+                print(f" -> {label}: {len(rows)} figure di spicco.")
+                metrics.incr("figure esaminate", amount=len(rows))
+                for item in rows:
+                    candidate = parse_row(item)
+                    if candidate is None or candidate["qid"] in queued:
+                        continue
+                    probe = {"name": candidate["name"].replace('_', ' '), "slugs": {"EN": candidate["slug_en"]},
+                             "deathDate": candidate["death"], "qid": candidate["qid"]}
+                    if is_duplicate(store, pending, probe):
+                        continue
+                    queued.add(candidate["qid"])
+                    future = bios.submit(build_record, candidate["name"], candidate["slug_en"], candidate["birth"],
+                                         candidate["death"], candidate["image"], candidate["qid"])
+                    running[future] = ("record", None)
+
+    metrics.set_value("schede aggiunte", len(new_entries))
+    if skipped:
+        print(f"\n⚠️ Fasce non recuperate: {', '.join(skipped)}")
     if new_entries:
-        library.extend(new_entries)
-        library.sort(key=lambda x: x['deathDate'])
-        with open(JSON_FILE, "w", encoding="utf-8") as f:
-            json.dump(library, f, indent=2, ensure_ascii=False)
+        # Le risposte arrivano in ordine sparso: si ordina prima di fondere, così il file resta stabile
+        new_entries.sort(key=lambda r: (sort_key(r["deathDate"]), r["name"]))
+        # I nuovi VIP vengono ordinati tra loro e fusi nella timeline esistente
+        store.add_many(new_entries)
+        store.commit()
         print(f"\n✅ SUCCESSO: {len(new_entries)} VIP aggiunti alla biblioteca!")
     else:
         print("\nNessun nuovo VIP trovato (o tutti i VIP scansionati sono già presenti).")
+    http_client.print_failure_report()
+
+def scan_dump(path, store, min_sitelinks=MIN_SITELINKS, start=None, end=None, limit=None):
+    """Candidati nuovi del dump, dal più noto; restituisce anche quante figure sono state esaminate."""
+    seen = set()
+    candidates = []
+    scanned = 0
+    for candidate in iter_candidates(path, min_sitelinks, start, end):
+        scanned += 1
+        slug_en = candidate["slug_en"] or candidate["name"].replace(' ', '_')
+        probe = {"name": candidate["name"], "slugs": {"EN": slug_en}, "deathDate": candidate["death"], "qid": candidate["qid"]}
+        # Nel dump ogni QID compare una volta sola: basta ricordare gli slug già visti
+        if store.find_duplicate(probe) is not None or slug_en.lower() in seen:
+            continue
+        seen.add(slug_en.lower())
+        candidate["slug_en"] = slug_en
+        candidates.append(candidate)
+        if limit and len(candidates) > limit * 2:
+            # Memoria limitata anche su dump enormi: si scartano via via i meno noti
+            candidates = heapq.nlargest(limit, candidates, key=lambda c: c["sitelinks"])
+    return sorted(candidates, key=lambda c: c["sitelinks"], reverse=True)[:limit or None], scanned
+
+def run_dump_import(path, min_sitelinks=MIN_SITELINKS, start=None, end=None, limit=None):
+    """
+    Importazione offline da un dump JSON di Wikidata (anche compresso .gz/.bz2): un solo passaggio
+    lineare sul file, senza limiti per epoca e con qualsiasi intervallo di date, anche avanti Cristo.
+    Con `limit` si tengono solo le persone con più sitelink, come faceva ORDER BY DESC(?sitelinks).
+    """
+    print(f"Avvio importazione dal dump {path} (sitelink >= {min_sitelinks})...")
+    store = LibraryStore(JSON_FILE)
+    with metrics.timer("fase.lettura_dump"):
+        candidates, scanned = scan_dump(path, store, min_sitelinks, start, end, limit)
+    metrics.set_value("figure esaminate", scanned)
+    print(f" -> {scanned} figure di spicco nel dump, {len(candidates)} nuove da importare.")
+
+    # Le biografie arrivano da Wikipedia in parallelo, con i limiti per host del client condiviso
+    records = parallel_map(
+        lambda c: build_record(c["name"], c["slug_en"], c["birth"], c["death"], c["image"], c["qid"]),
+        candidates
+    )
+    pending = NameIndex()
+    new_entries = []
+    for record in records:
+        # Lo slug IT può coincidere con una scheda già presente o appena aggiunta
+        if is_duplicate(store, pending, record):
+            continue
+        pending.add(len(new_entries), record)
+        new_entries.append(record)
+
+    metrics.set_value("schede aggiunte", len(new_entries))
+    if new_entries:
+        store.add_many(new_entries)
+        store.commit()
+        print(f"\n✅ SUCCESSO: {len(new_entries)} VIP aggiunti alla biblioteca dal dump!")
+    else:
+        print("\nNessun nuovo VIP trovato nel dump.")
+    http_client.print_failure_report()
+
+def option(argv, name, default=None, cast=str):
+    return cast(argv[argv.index(name) + 1]) if name in argv and argv.index(name) + 1 < len(argv) else default
 
 if __name__ == "__main__":
-    run_historical_import()
+    metrics.start_run("historical_importer")
+    # python historical_importer.py --dump latest-all.json.gz [--min-sitelinks 40] [--from -500] [--to 1979] [--limit 5000]
+    if "--dump" in sys.argv:
+        run_dump_import(
+            option(sys.argv, "--dump"),
+            min_sitelinks=option(sys.argv, "--min-sitelinks", MIN_SITELINKS, int),
+            start=option(sys.argv, "--from", None, int),
+            end=option(sys.argv, "--to", None, int),
+            limit=option(sys.argv, "--limit", None, int),
+        )
+    else:
+        run_historical_import()
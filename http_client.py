@@ -0,0 +1,175 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from fetch_engine import host_group, limiter_for, register_alias
+
+# Client HTTP condiviso da tutti gli script: una sola Session con connessioni keep-alive
+# riutilizzate per host, tentativi con attesa esponenziale e limiti di concorrenza per host.
+# (requests non parla HTTP/2: il guadagno principale viene dal riuso delle connessioni TLS.)
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Richieste contemporanee per gruppo di host (Wikidata ne accetta al massimo 5 per IP)
+HOST_CONCURRENCY = {
+    "wikipedia.org": 8,
+    "query.wikidata.org": 5,
+    "wikimedia.org": 8,
+}
+DEFAULT_CONCURRENCY = 4
+
+# Indirizzi dei servizi. Si possono sovrascrivere per puntare al server finto dei benchmark:
+# WIKIPEDIA_URL=http://127.0.0.1:8801/{lang}  WIKIDATA_SPARQL_URL=http://127.0.0.1:8802/sparql
+WIKIPEDIA_URL = os.environ.get("WIKIPEDIA_URL", "https://{lang}.wikipedia.org")
+SPARQL_URL = os.environ.get("WIKIDATA_SPARQL_URL", "https://query.wikidata.org/sparql")
+# Il server sostitutivo eredita limiti e concorrenza del servizio vero
+if "WIKIPEDIA_URL" in os.environ:
+    register_alias(WIKIPEDIA_URL, "wikipedia.org")
+if "WIKIDATA_SPARQL_URL" in os.environ:
+    register_alias(SPARQL_URL, "query.wikidata.org")
+
+_session = None
+_session_lock = threading.Lock()
+_semaphores = {}
+_failures = []
+_failures_lock = threading.Lock()
+
+
+def wikipedia_url(lang, path):
+    # wikipedia_url("it", "/w/api.php") -> "https://it.wikipedia.org/w/api.php"
+    return WIKIPEDIA_URL.format(lang=lang) + path
+
+
+def session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=16)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def _semaphore(group):
+    with _session_lock:
+        if group not in _semaphores:
+            _semaphores[group] = threading.BoundedSemaphore(HOST_CONCURRENCY.get(group, DEFAULT_CONCURRENCY))
+        return _semaphores[group]
+
+
+def retry_after_seconds(response):
+    """Legge Retry-After (secondi o data HTTP); None se assente o illeggibile."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value.strip())
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, response=None):
+    # Se il server dice quanto aspettare lo si ascolta, altrimenti attesa esponenziale con jitter
+    hinted = retry_after_seconds(response)
+    if hinted is not None:
+        return min(hinted, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def record_failure(method, url, status=None, error=None, attempts=1):
+    with _failures_lock:
+        _failures.append({
+            "method": method,
+            "url": url,
+            "host": host_group(url),
+            "status": status,
+            "error": error,
+            "attempts": attempts,
+        })
+
+
+def failures():
+    with _failures_lock:
+        return list(_failures)
+
+
+def failure_summary():
+    """Errori raggruppati per host: {host: {"count", "statuses", "errors"}}."""
+    summary = {}
+    for failure in failures():
+        entry = summary.setdefault(failure["host"], {"count": 0, "statuses": {}, "errors": {}})
+        entry["count"] += 1
+        if failure["status"]:
+            key = str(failure["status"])
+            entry["statuses"][key] = entry["statuses"].get(key, 0) + 1
+        if failure["error"]:
+            entry["errors"][failure["error"]] = entry["errors"].get(failure["error"], 0) + 1
+    return summary
+
+
+def print_failure_report():
+    summary = failure_summary()
+    if not summary:
+        return
+    print("\n⚠️ Richieste fallite dopo tutti i tentativi:")
+    for host, entry in sorted(summary.items()):
+        details = ", ".join(f"HTTP {s} x{n}" for s, n in entry["statuses"].items())
+        details += (", " if details and entry["errors"] else "") + ", ".join(f"{e} x{n}" for e, n in entry["errors"].items())
+        print(f" -> {host}: {entry['count']} ({details})")
+
+
+def request(method, url, max_retries=MAX_RETRIES, **kwargs):
+    """
+    Esegue una richiesta rispettando il secchio di gettoni e il limite di concorrenza dell'host.
+    Riprova sugli errori di rete (qualsiasi requests.RequestException, comprese le risposte troncate)
+    e sugli stati 429/5xx. Restituisce l'ultima risposta ricevuta
+    (anche se non è 200) oppure solleva l'ultima eccezione di rete; ogni fallimento definitivo
+    viene registrato per il riepilogo finale.
+    """
+    group = host_group(url)
+    last_error = None
+    for attempt in range(max_retries + 1):
+        with metrics.timer(f"http.attesa[{group}]"):
+            limiter_for(url).acquire()
+        response = None
+        try:
+            with _semaphore(group), metrics.timer(f"http[{group}]"):
+                response = session().request(method, url, **kwargs)
+        except requests.RequestException as e:
+            last_error = e
+            metrics.incr("http.errori_rete", group)
+        else:
+            metrics.incr("http.richieste", group)
+            metrics.incr("http.byte", group, len(response.content or b""))
+            metrics.incr("http.stato", f"{group} {response.status_code}")
+            if response.status_code not in RETRY_STATUSES:
+                return response
+        if attempt < max_retries:
+            metrics.incr("http.tentativi_ripetuti", group)
+            time.sleep(backoff_delay(attempt, response))
+
+    metrics.incr("http.fallimenti", group)
+    if response is not None:
+        record_failure(method, url, status=response.status_code, attempts=max_retries + 1)
+        return response
+    record_failure(method, url, error=type(last_error).__name__, attempts=max_retries + 1)
+    raise last_error
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
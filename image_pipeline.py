@@ -0,0 +1,184 @@
+import hashlib
+import io
+import json
+import os
+
+import http_client
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    # Pillow è facoltativo: senza il modulo la fase delle miniature viene saltata
+    Image = None
+
+# Miniature delle foto, salvate nel repository e servite da raw.githubusercontent.com.
+# Il nome del file dipende dall'hash dell'immagine sorgente: stessa foto, stesso file,
+# quindi le schede che condividono una foto condividono anche le miniature.
+# Le schede non le contengono: images/thumbs/index.json associa a ogni foto sorgente il suo
+# hash e gli URL si ricavano da lì (build_distribution li pubblica in dist/index.json).
+IMAGES_DIR = "images"
+THUMBS_DIR = os.path.join(IMAGES_DIR, "thumbs")
+THUMBS_INDEX = os.path.join(THUMBS_DIR, "index.json")
+PUBLIC_BASE = "https://raw.githubusercontent.com/Gimmons1/imissyou-data/main/"
+# Larghezze in pixel: solo le celle della lista, che sono il problema di banda. La pagina di
+# dettaglio continua a usare imageUrl: una seconda misura raddoppierebbe i file nel repository
+SIZES = [160]
+FORMATS = ["jpg", "webp"]
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+# Commons sa ridimensionare da solo: si scarica già una versione ridotta invece dell'originale
+SOURCE_WIDTH = 960
+
+HEADERS = {'User-Agent': 'iMissYouApp_Thumbnailer/1.0 (https://github.com/Gimmons1)'}
+
+
+def available():
+    return Image is not None
+
+
+def source_url(url):
+    if "/wiki/Special:FilePath/" in url and "?" not in url:
+        return f"{url}?width={SOURCE_WIDTH}"
+    return url
+
+
+def local_path(url):
+    # Le foto caricate a mano sono già nel repository: si leggono dal disco
+    if url.startswith(PUBLIC_BASE):
+        path = url[len(PUBLIC_BASE):]
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def public_url(path):
+    return PUBLIC_BASE + path.replace(os.sep, "/")
+
+
+def fetch_source(url, etag=None):
+    """
+    Scarica l'immagine sorgente. Restituisce (stato, contenuto, etag): "same" se il server
+    risponde 304 Not Modified, "ok" con i byte dell'immagine, "missing" o "error" altrimenti.
+    """
+    path = local_path(url)
+    if path:
+        with open(path, "rb") as f:
+            return "ok", f.read(), None
+    headers = dict(HEADERS)
+    if etag:
+        headers["If-None-Match"] = etag
+    try:
+        res = http_client.get(source_url(url), headers=headers, timeout=(5, 30))
+    except Exception:
+        return "error", None, None
+    if res.status_code == 304:
+        return "same", None, etag
+    if res.status_code == 200 and res.content:
+        return "ok", res.content, res.headers.get("ETag")
+    return ("missing" if res.status_code in (403, 404, 410) else "error"), None, None
+
+
+def render(image, width, fmt):
+    thumb = image.copy()
+    # Solo la larghezza è vincolata: l'altezza segue le proporzioni (con un tetto per le foto molto alte)
+    thumb.thumbnail((width, width * 2), Image.LANCZOS)
+    out = io.BytesIO()
+    if fmt == "webp":
+        thumb.save(out, "WEBP", quality=WEBP_QUALITY, method=6)
+    else:
+        thumb.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def formats():
+    return ["jpg", "webp"] if features.check("webp") else ["jpg"]
+
+
+def thumb_path(digest, width, fmt):
+    return os.path.join(THUMBS_DIR, digest[:2], f"{digest}-{width}.{fmt}")
+
+
+def thumbnail_urls(digest):
+    """{"jpg": {"160": url}, "webp": {...}} per le miniature di quell'hash presenti su disco (niente Pillow)."""
+    thumbnails = {}
+    for fmt in FORMATS:
+        for width in SIZES:
+            path = thumb_path(digest, width, fmt)
+            if os.path.exists(path):
+                thumbnails.setdefault(fmt, {})[str(width)] = public_url(path)
+    return thumbnails
+
+
+def write_thumbnails(content):
+    """
+    Genera le miniature di un'immagine e restituisce l'hash che le identifica.
+    Se i file con lo stesso hash esistono già non si decodifica nemmeno l'immagine.
+    """
+    digest = hashlib.sha256(content).hexdigest()[:20]
+    folder = os.path.join(THUMBS_DIR, digest[:2])
+    targets = {(fmt, width): thumb_path(digest, width, fmt) for fmt in formats() for width in SIZES}
+    missing = [key for key, path in targets.items() if not os.path.exists(path)]
+    if missing:
+        image = Image.open(io.BytesIO(content))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        os.makedirs(folder, exist_ok=True)
+        for fmt, width in missing:
+            path = targets[(fmt, width)]
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(render(image, width, fmt))
+            os.replace(tmp_path, path)
+    return digest
+
+
+def make_thumbnails(url, etag=None):
+    """
+    Porta a termine la fase miniature per una foto: (stato, hash delle miniature, etag).
+    Con stato "same" la sorgente non è cambiata e le miniature già registrate restano valide.
+    """
+    status, content, new_etag = fetch_source(url, etag)
+    if status != "ok":
+        return status, None, new_etag
+    try:
+        return "ok", write_thumbnails(content), new_etag
+    except Exception as e:
+        # File che non è un'immagine (o formato non supportato): come se la foto non ci fosse
+        print(f" -> Immagine illeggibile {url}: {e}")
+        return "missing", None, None
+
+
+class ThumbnailIndex:
+    """Foto sorgente -> hash delle sue miniature, salvato in images/thumbs/index.json."""
+
+    def __init__(self, path=THUMBS_INDEX):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                try: self.entries = json.load(f)
+                except: self.entries = {}
+
+    def get(self, url):
+        return self.entries.get(url) if url else None
+
+    def set(self, url, digest):
+        changed = self.entries.get(url) != digest
+        self.entries[url] = digest
+        return changed
+
+    def urls(self, url):
+        digest = self.get(url)
+        return thumbnail_urls(digest) if digest else {}
+
+    def save(self, library=None):
+        if library is not None:
+            # Dimentica le foto che nessuna scheda usa più (i file restano: altre foto identiche li condividono)
+            used = {p.get("imageUrl") for p in library}
+            self.entries = {url: digest for url, digest in self.entries.items() if url in used}
+        if not self.entries and not os.path.exists(self.path):
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,467 @@
+import bisect
+import hashlib
+import heapq
+import json
+import os
+import re
+import sys
+import uuid
+
+from changelog import append_version, last_entry
+from dates import sort_key
+from name_index import NameIndex
+
+JSON_FILE = "library.json"
+# Diario delle modifiche: una riga per scheda cambiata, compattato poi in library.json
+JOURNAL_FILE = "library.journal.jsonl"
+# Oltre questa dimensione il diario viene compattato anche da un commit(compact=False) a metà lavoro
+COMPACT_BYTES = 256 * 1024
+# Blocchi di lettura per l'impronta e per il caricamento a schede di library.json
+READ_CHUNK = 1024 * 1024
+# Spazi e virgole tra una scheda e l'altra dell'array
+SEPARATORS = re.compile(r"[\s,]*")
+
+
+def record_key(record):
+    # Identità stabile di una scheda: slug inglese, poi italiano, infine il nome
+    slugs = record.get("slugs", {})
+    return slugs.get("EN") or slugs.get("IT") or record["name"]
+
+
+def new_uid(record):
+    # Il QID se è noto; altrimenti casuale, così due job paralleli non assegnano mai lo stesso uid
+    return record.get("qid") or uuid.uuid4().hex[:12]
+
+
+def assign_uids(records):
+    """
+    Dà un uid alle schede che non l'hanno ancora (salvate prima degli uid o scritte a mano).
+    L'uid è il QID, oppure un hash di slug, nome e data di morte: lo stesso file dà sempre
+    gli stessi uid, anche se lo leggono due job diversi prima che uno dei due li salvi.
+    """
+    used = {record["uid"] for record in records if record.get("uid")}
+    assigned = 0
+    for record in records:
+        if record.get("uid"):
+            continue
+        raw = f"{record_key(record)}|{record.get('name', '')}|{record.get('deathDate', '')}"
+        uid = record.get("qid") or hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+        suffix = 1
+        while uid in used:
+            # Doppioni identici: il secondo riceve l'hash con un contatore
+            suffix += 1
+            uid = hashlib.sha1(f"{raw}#{suffix}".encode("utf-8")).hexdigest()[:12]
+        record["uid"] = uid
+        used.add(uid)
+        assigned += 1
+    return assigned
+
+
+def write_library_stream(records, path):
+    """
+    Scrive la biblioteca una scheda alla volta, senza costruire in memoria il testo dell'intero file.
+    Il risultato è identico byte per byte a json.dump(library, f, indent=2, ensure_ascii=False).
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        first = True
+        for record in records:
+            f.write("[\n  " if first else ",\n  ")
+            f.write(json.dumps(record, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+            first = False
+        f.write("[]" if first else "\n]")
+    os.replace(tmp_path, path)
+
+
+def iter_library(path):
+    """
+    Legge l'array di library.json una scheda alla volta, a blocchi di READ_CHUNK, invece di
+    json.load sull'intero testo: in memoria restano le schede, non anche tutto il file come stringa.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(READ_CHUNK)
+        pos = SEPARATORS.match(buffer).end()
+        if buffer[pos:pos + 1] != "[":
+            raise ValueError(f"{path}: non è un array JSON")
+        pos += 1
+        eof = False
+        while True:
+            pos = SEPARATORS.match(buffer, pos).end()
+            if buffer[pos:pos + 1] == "]":
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Scheda a cavallo di due blocchi: si tiene solo la parte non letta e si aggiunge il blocco dopo
+                if eof:
+                    raise
+                chunk = f.read(READ_CHUNK)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield record
+
+
+def file_fingerprint(path):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LibraryStore:
+    """
+    Biblioteca in memoria con indici per nome (minuscolo), per slug e per data di morte,
+    più un NameIndex (nomi e slug normalizzati, QID, trigrammi) per riconoscere i doppioni.
+    Ogni scheda ha anche un "uid" salvato nel file, che non cambia mai (nemmeno se cambiano
+    slug o nome): è l'identità usata da distribuzione, registri e fusione tra job paralleli.
+    L'ordine per data di morte è un invariante: `order` contiene le coppie (deathDate, id)
+    sempre ordinate: add() trova il posto con una ricerca binaria (l'inserimento nella lista resta
+    O(n)), add_many() fonde un intero gruppo con un solo passaggio.
+    Le modifiche si salvano come righe nel diario (solo le schede cambiate, per uid); commit()
+    a fine gruppo registra la versione e compatta nel library.json canonico, il file che scaricano
+    i client, così ogni esecuzione pubblica subito le sue modifiche.
+
+    Ogni scheda ha anche un id interno (intero) che vale solo per questa istanza e serve
+    agli indici e all'ordine della timeline.
+    """
+
+    def __init__(self, path=JSON_FILE, journal_path=JOURNAL_FILE):
+        self.path = path
+        self.journal_path = journal_path
+        self.reload()
+
+    def reload(self):
+        """(Ri)legge library.json e il diario da capo."""
+        path = self.path
+        self.records = {}
+        self.next_id = 0
+        self.by_name = {}
+        self.by_slug = {}
+        self.by_death = {}
+        self.by_uid = {}
+        # Nomi e slug normalizzati, QID e trigrammi per riconoscere i doppioni
+        self.names = NameIndex()
+        self.order = []
+        self.dirty = set()
+        # id interno -> uid delle schede eliminate e non ancora scritte nel diario
+        self.deleted = {}
+        # Schede toccate dopo l'ultima versione registrata, per il registro delle versioni
+        self.touched = set()
+        self.removed = set()
+        # Diario scritto su un'altra versione del file: il prossimo salvataggio lo ricomincia
+        self.journal_stale = False
+
+        library = []
+        if os.path.exists(path):
+            try: library = list(iter_library(path))
+            except: library = []
+        self.base = file_fingerprint(path)
+        assign_uids(library)
+        for record in library:
+            rid = self._insert(record, ordered=False)
+            self.order.append(self._sort_key(rid))
+        # Il file è già ordinato: si riordina solo se qualcuno l'ha modificato a mano
+        if any(self.order[i] > self.order[i + 1] for i in range(len(self.order) - 1)):
+            self.order.sort()
+        self.base_keys = {rid: record_key(record) for rid, record in self.records.items()}
+        self.base_uids = {rid: record["uid"] for rid, record in self.records.items()}
+        self._replay_journal()
+
+    # --- Indici ---
+
+    def _index(self, rid):
+        record = self.records[rid]
+        self.by_name.setdefault(record.get("name", "").lower(), []).append(rid)
+        for slug in record.get("slugs", {}).values():
+            if slug:
+                self.by_slug.setdefault(slug.lower(), set()).add(rid)
+        self.by_death.setdefault(record.get("deathDate", ""), set()).add(rid)
+        self.by_uid[record["uid"]] = rid
+        self.names.add(rid, record)
+
+    def _unindex(self, rid):
+        record = self.records[rid]
+        name_ids = self.by_name.get(record.get("name", "").lower(), [])
+        if rid in name_ids: name_ids.remove(rid)
+        for slug in record.get("slugs", {}).values():
+            if slug: self.by_slug.get(slug.lower(), set()).discard(rid)
+        self.by_death.get(record.get("deathDate", ""), set()).discard(rid)
+        if self.by_uid.get(record["uid"]) == rid:
+            del self.by_uid[record["uid"]]
+        self.names.remove(rid, record)
+
+    def _insert(self, record, rid=None, ordered=True):
+        if rid is None:
+            rid = self.next_id
+        self.next_id = max(self.next_id, rid + 1)
+        self.records[rid] = record
+        self._index(rid)
+        if ordered:
+            # A parità di data la scheda nuova va dopo quelle esistenti, come con un sort stabile
+            bisect.insort(self.order, self._sort_key(rid))
+        return rid
+
+    def _remove(self, rid):
+        self._unindex(rid)
+        key = self._sort_key(rid)
+        pos = bisect.bisect_left(self.order, key)
+        if pos < len(self.order) and self.order[pos] == key:
+            del self.order[pos]
+        del self.records[rid]
+
+    def _sort_key(self, rid):
+        # Ordine cronologico vero: come stringhe "-0500-..." finirebbe dopo "-0034-..."
+        return (sort_key(self.records[rid].get("deathDate", "")), rid)
+
+    def _ordered(self, rids):
+        return sorted(rids, key=self._sort_key)
+
+    # --- Diario ---
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        if not lines:
+            return
+        header = json.loads(lines[0])
+        # Il diario si riferisce a una versione precedente del file: è già stato compattato
+        if header.get("base") != self.base:
+            self.journal_stale = True
+            return
+        for line in lines[1:]:
+            try: entry = json.loads(line)
+            except: break  # Riga troncata da un'interruzione: ci si ferma all'ultima completa
+            if entry["op"] == "version":
+                # Quello che precede è già nel registro delle versioni
+                self._versioned()
+                continue
+            rid = self.by_uid.get(entry["uid"])
+            if rid is not None:
+                self._remove(rid)
+            if entry["op"] == "put":
+                rid = self._insert(entry["record"], rid)
+                self.touched.add(rid)
+            elif rid is not None:
+                self.removed.add(rid)
+
+    def _versioned(self):
+        # Le modifiche registrate diventano la nuova base per le versioni successive
+        for rid in self.touched:
+            if rid in self.records:
+                self.base_keys[rid] = record_key(self.records[rid])
+                self.base_uids[rid] = self.records[rid]["uid"]
+        for rid in self.removed:
+            if rid not in self.records:
+                self.base_keys.pop(rid, None)
+                self.base_uids.pop(rid, None)
+        self.touched.clear()
+        self.removed.clear()
+
+    def _append_journal(self, entries):
+        restart = self.journal_stale or not os.path.exists(self.journal_path) or os.path.getsize(self.journal_path) == 0
+        with open(self.journal_path, "w" if restart else "a", encoding="utf-8") as f:
+            if restart:
+                f.write(json.dumps({"base": self.base}) + "\n")
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.journal_stale = False
+
+    def save(self):
+        """Aggiunge al diario solo le schede modificate dall'ultimo salvataggio."""
+        if not self.dirty and not self.deleted:
+            return 0
+        entries = [{"op": "delete", "uid": uid} for _, uid in sorted(self.deleted.items())]
+        entries += [{"op": "put", "uid": self.records[rid]["uid"], "record": self.records[rid]} for rid in sorted(self.dirty - set(self.deleted))]
+        self._append_journal(entries)
+        written = len(self.dirty | set(self.deleted))
+        self.touched |= self.dirty
+        self.removed |= set(self.deleted)
+        self.dirty.clear()
+        self.deleted.clear()
+        return written
+
+    def pending_changes(self):
+        """
+        Modifiche dopo l'ultima versione registrata, nel formato del registro versionato.
+        Ogni modifica porta l'uid (univoco) e la chiave per slug dei client meno recenti.
+        """
+        changes = []
+        for rid in sorted(self.removed):
+            if rid in self.base_keys and rid not in self.records:
+                changes.append({"op": "delete", "uid": self.base_uids[rid], "key": self.base_keys[rid]})
+        for rid in sorted(self.touched):
+            if rid not in self.records:
+                continue
+            record = self.records[rid]
+            key = record_key(record)
+            uid = record["uid"]
+            if rid not in self.base_keys:
+                changes.append({"op": "add", "uid": uid, "key": key, "record": record})
+            elif self.base_keys[rid] != key:
+                # Cambiare lo slug inglese cambia la chiave: per i client che usano la chiave è una sostituzione
+                changes.append({"op": "delete", "uid": uid, "key": self.base_keys[rid]})
+                changes.append({"op": "add", "uid": uid, "key": key, "record": record})
+            else:
+                changes.append({"op": "update", "uid": uid, "key": key, "record": record})
+        return changes
+
+    def commit(self, compact=True):
+        """
+        Fine di un gruppo di comandi: salva il diario, registra le modifiche come nuova versione
+        e compatta library.json. Con compact=False (un punto intermedio di un lavoro lungo) si
+        compatta solo se il diario è cresciuto oltre COMPACT_BYTES.
+        Il diario si salva prima del registro e il registro prima della compattazione: un'interruzione
+        in qualunque punto non perde la versione, la fa solo registrare dal commit successivo.
+        Restituisce il numero della versione corrente.
+        """
+        self.save()
+        changes = self.pending_changes()
+        last = last_entry()
+        if changes and last and last["changes"] == changes:
+            # Interruzione dopo il registro ma prima del segno nel diario: la versione c'è già
+            version = last["version"]
+        else:
+            version = append_version(changes)
+        if changes:
+            # Il segno nel diario dice che fin qui è tutto registrato: rileggendolo non si ripete
+            self._append_journal([{"op": "version", "version": version}])
+            self._versioned()
+            print(f"📚 Biblioteca salvata (versione {version}).")
+        if compact or (os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > COMPACT_BYTES):
+            self.compact()
+        return version
+
+    def compact(self):
+        """Riscrive library.json (ordinato per data di morte) con tutto il diario e lo svuota."""
+        self.save()
+        if not os.path.exists(self.journal_path):
+            return False
+        write_library_stream((self.records[rid] for _, rid in self.order), self.path)
+        # Dopo la sostituzione il diario non combacia più con il file: si può eliminare senza rischi
+        os.remove(self.journal_path)
+        print(f"📚 Diario compattato in {self.path}.")
+        self.reload()
+        return True
+
+    # --- Lettura ---
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def to_list(self):
+        return [self.records[rid] for _, rid in self.order]
+
+    def items(self):
+        """Coppie (id, scheda) nell'ordine della timeline."""
+        return [(rid, self.records[rid]) for _, rid in self.order]
+
+    def get(self, rid):
+        return self.records[rid]
+
+    def find_by_uid(self, uid):
+        return self.by_uid.get(uid)
+
+    def find_by_name(self, name):
+        return list(self.by_name.get(name.lower(), []))
+
+    def find_by_slug(self, slug):
+        return self._ordered(self.by_slug.get(slug.lower(), set()))
+
+    def find_by_death_date(self, death_date):
+        return self._ordered(self.by_death.get(death_date, set()))
+
+    def has_name(self, name):
+        return bool(self.by_name.get(name.lower()))
+
+    def has_slug(self, slug):
+        return bool(self.by_slug.get(slug.lower()))
+
+    def find_duplicate(self, record, match_name=False):
+        """Id di una scheda che rappresenta la stessa persona (QID, slug o nome normalizzati), oppure None."""
+        return self.names.find_duplicate(record, match_name)
+
+    def mentions(self, text):
+        # Esiste almeno un nome che contiene il testo, ignorando maiuscole, accenti e underscore
+        return self.names.contains(text)
+
+    # --- Scrittura ---
+
+    def _claim_uid(self, record):
+        # Le schede nuove ricevono un uid libero (un doppione dello stesso QID ne riceve uno casuale)
+        if not record.get("uid") or record["uid"] in self.by_uid:
+            uid = new_uid(record)
+            record["uid"] = uid if uid not in self.by_uid else uuid.uuid4().hex[:12]
+
+    def add(self, record):
+        self._claim_uid(record)
+        rid = self._insert(record)
+        self.dirty.add(rid)
+        return rid
+
+    def add_many(self, records):
+        """
+        Inserisce un gruppo di schede: il gruppo viene ordinato da solo e poi fuso con la timeline
+        esistente con un solo heapq.merge, O(n + k log k) invece di k inserimenti da O(n).
+        """
+        records = list(records)
+        if not records:
+            return []
+        rids = []
+        for record in records:
+            self._claim_uid(record)
+            rid = self._insert(record, ordered=False)
+            self.dirty.add(rid)
+            rids.append(rid)
+        batch = sorted(self._sort_key(rid) for rid in rids)
+        self.order = list(heapq.merge(self.order, batch))
+        return rids
+
+    def update(self, rid, **fields):
+        record = self.records[rid]
+        if "deathDate" in fields and fields["deathDate"] != record.get("deathDate"):
+            self._remove(rid)
+            record.update(fields)
+            self._insert(record, rid)
+        else:
+            self._unindex(rid)
+            record.update(fields)
+            self._index(rid)
+        self.dirty.add(rid)
+
+    def delete(self, rid):
+        self.deleted[rid] = self.records[rid]["uid"]
+        self._remove(rid)
+        self.dirty.discard(rid)
+
+    def approve(self, name):
+        rids = self.find_by_name(name)
+        for rid in rids:
+            self.update(rid, approved=True)
+        return len(rids)
+
+    def delete_by_name(self, name, count=1):
+        # Elimina al massimo `count` schede con quel nome, nell'ordine della timeline
+        rids = self._ordered(self.find_by_name(name))[:count]
+        for rid in rids:
+            self.delete(rid)
+        return len(rids)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        store = LibraryStore()
+        pending = os.path.exists(store.journal_path)
+        store.commit()
+        if not pending:
+            print("📚 Nessuna modifica da compattare.")
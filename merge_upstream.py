@@ -0,0 +1,370 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from analytics_log import ANALYTICS_FILE, EVENTS_DIR, ROLLUPS_FILE, fold_events, normalize_totals
+from changelog import CHANGELOG_FILE
+from dates import sort_key
+from library_store import JOURNAL_FILE, JSON_FILE, LibraryStore, assign_uids, record_key, write_library_stream
+
+# Salvataggio dei workflow senza --force: prima di ogni push si scarica la versione remota e si
+# rifanno le nostre modifiche sopra di essa con una fusione a tre vie (base = commit da cui il job
+# è partito, nostra = file di lavoro, loro = remoto) fatta scheda per scheda, contatore per contatore.
+# Così più job possono girare insieme senza perdere approvazioni, eliminazioni o visualizzazioni.
+#
+#   python merge_upstream.py --message "🤖 Aggiornamento" library.json analytics_events changes dist
+LEGACY_AUDIT_FILE = "admin_logs.json"
+AUDIT_INDEX_FILE = "admin_audit/index.json"
+DIST_DIR = "dist"
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 5
+BOT_NAME = "github-actions[bot]"
+BOT_EMAIL = "41898282+github-actions[bot]@users.noreply.github.com"
+
+# Valore assente da un lato della fusione (diverso da None, che è un valore valido in JSON)
+MISSING = object()
+
+
+# --- Fusione dei valori ---
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def merge_values(base, ours, theirs, counters=False):
+    """
+    Fusione a tre vie di valori JSON: vince il lato che ha cambiato qualcosa rispetto alla base.
+    Se cambiano entrambi, gli oggetti si fondono chiave per chiave, i contatori sommano le due
+    differenze (con `counters`), le liste si uniscono; negli altri casi vince la nostra modifica.
+    Una chiave tolta da un lato e modificata dall'altro resta tolta.
+    """
+    if ours == theirs or theirs == base:
+        return ours
+    if ours == base:
+        return theirs
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        base = base if isinstance(base, dict) else {}
+        merged = {}
+        for key in list(theirs) + [k for k in ours if k not in theirs]:
+            value = merge_values(base.get(key, MISSING), ours.get(key, MISSING), theirs.get(key, MISSING), counters)
+            if value is not MISSING:
+                merged[key] = value
+        return merged
+    if counters and is_number(ours) and is_number(theirs):
+        return theirs + ours - (base if is_number(base) else 0)
+    if isinstance(ours, list) and isinstance(theirs, list):
+        return theirs + [item for item in ours if item not in theirs and (not isinstance(base, list) or item not in base)]
+    return ours
+
+
+def keyed(records):
+    """
+    {uid: scheda}. L'uid non cambia con slug o nome, quindi uno slug corretto da un lato resta
+    la stessa scheda anche per l'altro. Le schede ancora senza uid ricevono quello derivato dal
+    contenuto (lo stesso su tutti e tre i lati, finché non lo salva qualcuno).
+    """
+    records = [dict(record) for record in records]
+    assign_uids(records)
+    return {record["uid"]: record for record in records}
+
+
+def merge_library(base, ours, theirs):
+    """
+    Fusione a tre vie della biblioteca, scheda per scheda (per uid) e campo per campo.
+    Un'eliminazione vince su una modifica fatta dall'altro lato; le aggiunte di entrambi restano,
+    tranne una nostra aggiunta della stessa persona (stesso QID) già aggiunta dall'altro job.
+    """
+    base_map, ours_map, theirs_map = keyed(base), keyed(ours), keyed(theirs)
+    theirs_qids = {r["qid"] for r in theirs_map.values() if r.get("qid")}
+
+    merged = []
+    for uid in list(theirs_map) + [u for u in ours_map if u not in theirs_map]:
+        mine, other = ours_map.get(uid, MISSING), theirs_map.get(uid, MISSING)
+        if uid in base_map and (mine is MISSING or other is MISSING):
+            continue
+        if other is MISSING:
+            if mine.get("qid") in theirs_qids:
+                continue
+            merged.append(mine)
+        elif mine is MISSING:
+            merged.append(other)
+        else:
+            merged.append(merge_values(base_map.get(uid, {}), mine, other))
+    # Stesso ordine della LibraryStore: per data di morte, a parità nell'ordine remoto
+    return sorted(merged, key=lambda r: sort_key(r.get("deathDate", "")))
+
+
+def subtract(data, amounts):
+    # Toglie da `data` i contatori di `amounts` (stessa forma annidata)
+    for key, value in amounts.items():
+        if isinstance(value, dict) and isinstance(data.get(key), dict):
+            subtract(data[key], value)
+        elif is_number(value) and is_number(data.get(key)):
+            data[key] -= value
+    return data
+
+
+def folded_twice(paths, base, upstream):
+    """
+    Visualizzazioni dei segmenti che entrambi i job hanno sommato ed eliminato (due `reduce`
+    sovrapposti): la somma delle due differenze le conterebbe due volte, quindi vanno tolte una volta.
+    Restituisce (totali, riepiloghi) con i soli contributi di quei segmenti.
+    """
+    totals, rollups = {}, {"daily": {}, "weekly": {}}
+    for path in sorted(paths):
+        if not path.startswith(EVENTS_DIR + "/") or read_local(path) is not None or show(upstream, path) is not None:
+            continue
+        content = show(base, path)
+        if content:
+            fold_events(lines(content), totals, rollups)
+    return totals, rollups
+
+
+def merge_by_id(base, ours, theirs):
+    # Voci del registro admin: restano quelle remote (meno quelle tolte da noi) più le nostre nuove
+    base_ids = {e.get("id") for e in base}
+    ours_ids = {e.get("id") for e in ours}
+    theirs_ids = {e.get("id") for e in theirs}
+    merged = [e for e in theirs if e.get("id") in ours_ids or e.get("id") not in base_ids]
+    merged += [e for e in ours if e.get("id") not in theirs_ids and e.get("id") not in base_ids]
+    return sorted(merged, key=lambda e: e.get("date", 0), reverse=True)
+
+
+def merge_lines(base, ours, theirs):
+    # File in sola aggiunta (JSONL): righe remote, meno quelle tolte da noi, più le nostre nuove
+    base_set, ours_set, theirs_set = set(base), set(ours), set(theirs)
+    merged = [line for line in theirs if line in ours_set or line not in base_set]
+    return merged + [line for line in ours if line not in theirs_set and line not in base_set]
+
+
+def merge_changelog(base, ours, theirs, library):
+    """
+    Le nostre versioni nuove vanno in coda a quelle remote con i numeri successivi. Le schede
+    che contengono vengono prese dalla biblioteca fusa, così una nostra versione non annulla
+    un'approvazione arrivata dall'altro job.
+    """
+    if ours[:len(base)] != base:
+        return ours
+    records = {r["uid"]: r for r in library if r.get("uid")}
+    by_key = {record_key(r): r for r in library}
+    latest = json.loads(theirs[-1])["version"] if theirs else 0
+    merged = list(theirs)
+    for line in ours[len(base):]:
+        entry = json.loads(line)
+        changes = []
+        for change in entry["changes"]:
+            # Le versioni più vecchie hanno solo lo slug come chiave
+            record = records.get(change["uid"]) if change.get("uid") else by_key.get(change["key"])
+            if change["op"] == "delete":
+                # Con lo stesso uid ma un'altra chiave è la metà "vecchio slug" di una sostituzione
+                if record is None or record_key(record) != change["key"]:
+                    changes.append(change)
+            elif record is not None:
+                changes.append(dict(change, record=record))
+        if changes:
+            latest += 1
+            merged.append(json.dumps(dict(entry, version=latest, changes=changes), ensure_ascii=False))
+    return merged
+
+
+# --- Git ---
+
+def git(*args, check=True):
+    result = subprocess.run(["git"] + list(args), capture_output=True, text=True)
+    if check and result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)}: {result.stderr.strip()}")
+    return result
+
+
+def show(commit, path):
+    # Contenuto del file in quel commit, None se non esisteva
+    result = subprocess.run(["git", "show", f"{commit}:{path}"], capture_output=True)
+    return result.stdout if result.returncode == 0 else None
+
+
+def read_local(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def write_local(path, content):
+    if content is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def changed_paths(base, patterns):
+    """File dei percorsi salvati che il job ha modificato, creato o eliminato rispetto alla base."""
+    tracked = git("diff", "--name-only", base, "--", *patterns).stdout.split("\n")
+    untracked = git("ls-files", "--others", "--exclude-standard", "--", *patterns).stdout.split("\n")
+    return {path for path in tracked + untracked if path}
+
+
+def json_text(data, like):
+    # Stesso stile del file originale (chiavi ordinate o no), per non sporcare il diff
+    sort = like is not None and json.dumps(json.loads(like), indent=2, ensure_ascii=False, sort_keys=True) == like.decode("utf-8").strip()
+    return (json.dumps(data, indent=2, ensure_ascii=False, sort_keys=sort) + "\n").encode("utf-8")
+
+
+def materialize(library, journal):
+    """Schede di un lato: library.json più il suo diario non ancora compattato."""
+    folder = tempfile.mkdtemp()
+    try:
+        path, journal_path = os.path.join(folder, JSON_FILE), os.path.join(folder, JOURNAL_FILE)
+        write_local(path, library or b"[]")
+        write_local(journal_path, journal)
+        return LibraryStore(path, journal_path).to_list()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def load(content, default):
+    try: return json.loads(content) if content else default
+    except: return default
+
+
+def lines(content):
+    return [line for line in (content or b"").decode("utf-8").split("\n") if line.strip()]
+
+
+def merge_file(path, base, ours, theirs, twice=({}, {})):
+    """
+    Contenuto fuso di un file modificato da entrambi i lati; None se va tenuta la nostra versione.
+    `twice` sono i contributi dei segmenti di visualizzazioni sommati da entrambi (folded_twice).
+    """
+    if ours is None or theirs is None:
+        # Eliminato da un lato: come per le schede, l'eliminazione vince
+        return MISSING
+    if path == ANALYTICS_FILE:
+        # Anche la base nel formato normalizzato: la conversione dei vecchi contatori non va sommata due volte.
+        # Dalla nostra differenza si tolgono i segmenti già sommati anche dall'altro job
+        mine = subtract(normalize_totals(load(ours, {})), twice[0])
+        return json_text(merge_values(normalize_totals(load(base, {})), mine, normalize_totals(load(theirs, {})), counters=True), ours)
+    if path == ROLLUPS_FILE:
+        mine = subtract(load(ours, {}), twice[1])
+        return json_text(merge_values(load(base, {}), mine, load(theirs, {}), counters=True), ours)
+    if path == LEGACY_AUDIT_FILE:
+        return json_text(merge_by_id(load(base, []), load(ours, []), load(theirs, [])), None)
+    if path.endswith(".jsonl"):
+        return ("\n".join(merge_lines(lines(base), lines(ours), lines(theirs))) + "\n").encode("utf-8")
+    if path.endswith(".json"):
+        return json_text(merge_values(load(base, {}), load(ours, {}), load(theirs, {})), ours)
+    # Immagini e altri file binari: i nomi derivano dal contenuto, quindi la nostra copia va bene
+    return None
+
+
+def rebase_onto(base, upstream, ours):
+    """
+    Porta le nostre modifiche sopra il commit remoto: HEAD e indice passano al remoto, i file
+    cambiati solo là vengono presi così come sono, quelli cambiati da entrambi si fondono.
+    """
+    theirs = {path for path in git("diff", "--name-only", base, upstream).stdout.split("\n") if path}
+    git("reset", "-q", "--mixed", upstream)
+    for path in sorted(theirs - ours):
+        write_local(path, show(upstream, path))
+
+    both = ours & theirs
+    merged = []
+    library_files = {JSON_FILE, JOURNAL_FILE}
+    if ours & library_files and theirs & library_files:
+        # Biblioteca cambiata da entrambi (file o diario): si fondono le schede e si riparte compattati
+        library = merge_library(
+            materialize(show(base, JSON_FILE), show(base, JOURNAL_FILE)),
+            materialize(read_local(JSON_FILE), read_local(JOURNAL_FILE)),
+            materialize(show(upstream, JSON_FILE), show(upstream, JOURNAL_FILE)),
+        )
+        write_library_stream(library, JSON_FILE)
+        write_local(JOURNAL_FILE, None)
+        merged.append(JSON_FILE)
+    if CHANGELOG_FILE in both:
+        # I numeri di versione vanno riassegnati anche se la biblioteca non era in conflitto
+        library = materialize(read_local(JSON_FILE), read_local(JOURNAL_FILE))
+        text = merge_changelog(lines(show(base, CHANGELOG_FILE)), lines(read_local(CHANGELOG_FILE)), lines(show(upstream, CHANGELOG_FILE)), library)
+        write_local(CHANGELOG_FILE, ("\n".join(text) + "\n").encode("utf-8"))
+        merged.append(CHANGELOG_FILE)
+    twice = folded_twice(both, base, upstream)
+    for path in sorted(both):
+        if path in (JSON_FILE, JOURNAL_FILE, CHANGELOG_FILE, AUDIT_INDEX_FILE) or path.startswith(DIST_DIR + "/"):
+            continue
+        content = merge_file(path, show(base, path), read_local(path), show(upstream, path), twice)
+        if content is not None:
+            write_local(path, None if content is MISSING else content)
+            merged.append(path)
+
+    if any(path.startswith("admin_audit/") for path in ours | theirs):
+        # L'indice del registro admin si ricostruisce dai segmenti fusi
+        from audit_log import AuditIndex
+        AuditIndex.rebuild().save()
+    if any(path.startswith(DIST_DIR + "/") for path in ours):
+        # La distribuzione deriva dalla biblioteca: si riparte da quella remota (le patch già
+        # pubblicate non cambiano più) e la si rigenera sul risultato della fusione
+        for path in sorted(path for path in ours if path.startswith(DIST_DIR + "/")):
+            write_local(path, show(upstream, path))
+        from build_distribution import build_distribution
+        build_distribution()
+    return merged
+
+
+def commit(message):
+    identity = [] if git("config", "user.name", check=False).stdout.strip() else ["-c", f"user.name={BOT_NAME}", "-c", f"user.email={BOT_EMAIL}"]
+    git(*identity, "commit", "-q", "-m", message)
+
+
+def sync(patterns, message, branch=None, attempts=MAX_ATTEMPTS):
+    """Salva i percorsi indicati in un commit sopra l'ultima versione remota e lo pubblica, senza --force."""
+    branch = branch or os.environ.get("GITHUB_REF_NAME") or git("rev-parse", "--abbrev-ref", "HEAD").stdout.strip()
+    base = git("rev-parse", "HEAD").stdout.strip()
+    for attempt in range(1, attempts + 1):
+        ours = changed_paths(base, patterns)
+        if not ours:
+            print("💾 Nessuna modifica da salvare.")
+            return False
+        git("fetch", "-q", "origin", branch)
+        upstream = git("rev-parse", "FETCH_HEAD").stdout.strip()
+        if upstream != base:
+            merged = rebase_onto(base, upstream, ours)
+            if merged:
+                print(f"🔀 Fuse con la versione remota: {', '.join(merged)}")
+        # Solo i percorsi che esistono da qualche parte: git add rifiuta quelli sconosciuti
+        present = [p for p in patterns if os.path.exists(p) or git("ls-files", "--", p).stdout.strip()]
+        git("add", "-A", "--", *present)
+        if git("diff", "--cached", "--quiet", check=False).returncode == 0:
+            print("💾 Nessuna modifica da salvare dopo la fusione.")
+            return False
+        commit(message)
+        if git("push", "-q", "origin", f"HEAD:{branch}", check=False).returncode == 0:
+            print(f"💾 Modifiche salvate su {branch}.")
+            return True
+        # Un altro job ha pubblicato nel frattempo: si rifonde sopra il nuovo remoto
+        print(f"⏳ Il remoto è cambiato durante il salvataggio, nuovo tentativo ({attempt}/{attempts})...")
+        # Il nostro commit si disfa (i file restano com'erano) e si riparte dal remoto appena fuso
+        git("reset", "-q", "--mixed", upstream)
+        base = upstream
+        time.sleep(RETRY_DELAY * attempt)
+    sys.exit(f"Impossibile salvare su {branch} dopo {attempts} tentativi.")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    message = "🤖 Aggiornamento Database"
+    if "--message" in args:
+        position = args.index("--message")
+        message = args[position + 1]
+        args = args[:position] + args[position + 2:]
+    if not args:
+        sys.exit("Uso: python merge_upstream.py [--message TESTO] percorso [percorso ...]")
+    sync(args, message)
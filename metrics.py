@@ -0,0 +1,158 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Strumentazione leggera condivisa dagli script: contatori, tempi per fase e per host,
+# schede esaminate e modificate. A fine esecuzione si scrive un riepilogo JSON in .metrics/
+# e, dentro GitHub Actions, una tabella nel riepilogo del job (GITHUB_STEP_SUMMARY).
+# Con METRICS_PROFILE=cpu (cProfile) o METRICS_PROFILE=memory (tracemalloc) si aggiunge il profilo.
+METRICS_DIR = os.environ.get("METRICS_DIR", ".metrics")
+PROFILE = os.environ.get("METRICS_PROFILE", "").lower()
+TOP_ENTRIES = 15
+
+_lock = threading.Lock()
+_counters = {}
+_timers = {}
+_values = {}
+_run = {}
+
+
+def incr(name, label=None, amount=1):
+    """Incrementa un contatore, facoltativamente suddiviso per etichetta (per esempio l'host)."""
+    key = f"{name}[{label}]" if label else name
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, seconds):
+    with _lock:
+        entry = _timers.setdefault(name, {"count": 0, "seconds": 0.0, "max": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        entry["max"] = max(entry["max"], seconds)
+
+
+@contextmanager
+def timer(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """Decoratore: misura ogni chiamata della funzione sotto il nome `name`."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def set_value(name, value):
+    with _lock:
+        _values[name] = value
+
+
+def snapshot():
+    with _lock:
+        return {
+            "counters": dict(sorted(_counters.items())),
+            "timers": {k: {"count": v["count"], "seconds": round(v["seconds"], 3), "max": round(v["max"], 3)}
+                       for k, v in sorted(_timers.items())},
+            "values": dict(_values),
+        }
+
+
+def start_run(script):
+    """Da chiamare all'avvio di uno script: il riepilogo viene scritto automaticamente all'uscita."""
+    if _run:
+        return
+    _run.update({"script": script, "started": time.time(), "perf": time.perf_counter()})
+    if PROFILE == "cpu":
+        import cProfile
+        _run["profiler"] = cProfile.Profile()
+        _run["profiler"].enable()
+    elif PROFILE == "memory":
+        import tracemalloc
+        tracemalloc.start()
+    atexit.register(finish_run)
+
+
+def cpu_profile(path):
+    import pstats
+    profiler = _run["profiler"]
+    profiler.disable()
+    profiler.dump_stats(path)
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}:{function}", "calls": calls,
+                     "ownSeconds": round(own, 4), "cumulativeSeconds": round(cumulative, 4)})
+    return sorted(rows, key=lambda r: -r["cumulativeSeconds"])[:TOP_ENTRIES]
+
+
+def memory_profile():
+    import tracemalloc
+    current, peak = tracemalloc.get_traced_memory()
+    top = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ENTRIES]
+    tracemalloc.stop()
+    return {
+        "currentBytes": current,
+        "peakBytes": peak,
+        "top": [{"line": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count} for stat in top],
+    }
+
+
+def step_summary(report):
+    lines = [f"### ⏱️ {report['script']}: {report['wallSeconds']} s", ""]
+    if report["values"]:
+        lines += ["| Misura | Valore |", "|---|---|"]
+        lines += [f"| {k} | {v} |" for k, v in report["values"].items()]
+        lines.append("")
+    if report["timers"]:
+        lines += ["| Fase | Volte | Secondi | Max |", "|---|---:|---:|---:|"]
+        lines += [f"| {k} | {v['count']} | {v['seconds']} | {v['max']} |"
+                  for k, v in sorted(report["timers"].items(), key=lambda kv: -kv[1]["seconds"])]
+        lines.append("")
+    if report["counters"]:
+        lines += ["| Contatore | Valore |", "|---|---:|"]
+        lines += [f"| {k} | {v} |" for k, v in report["counters"].items()]
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def finish_run():
+    if not _run or _run.get("finished"):
+        return None
+    _run["finished"] = True
+    report = {
+        "script": _run["script"],
+        "startedAt": datetime.fromtimestamp(_run["started"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "wallSeconds": round(time.perf_counter() - _run["perf"], 3),
+        "runId": os.environ.get("GITHUB_RUN_ID"),
+    }
+    report.update(snapshot())
+
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    base = os.path.join(METRICS_DIR, f"{_run['script']}-{os.environ.get('GITHUB_RUN_ID') or int(_run['started'])}")
+    if "profiler" in _run:
+        report["cpuProfile"] = cpu_profile(base + ".prof")
+    elif PROFILE == "memory":
+        report["memoryProfile"] = memory_profile()
+
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    if os.environ.get("GITHUB_STEP_SUMMARY"):
+        with open(os.environ["GITHUB_STEP_SUMMARY"], "a", encoding="utf-8") as f:
+            f.write(step_summary(report))
+    print(f"⏱️ Metriche dell'esecuzione in {base}.json ({report['wallSeconds']} s).")
+    return report
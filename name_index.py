@@ -0,0 +1,133 @@
+import re
+import unicodedata
+
+# Indice dei nomi per riconoscere i doppioni: "García Márquez", "garcia_marquez" e "GARCIA MARQUEZ"
+# diventano la stessa chiave. Le ricerche per somiglianza e per sottostringa passano dai trigrammi,
+# quindi si confrontano solo le schede che condividono almeno un pezzo del nome invece di tutte.
+SIMILARITY = 0.85
+# Soglia più bassa per i doppioni, che richiedono anche la stessa data di morte:
+# "Lev Tolstoj" / "Leo Tolstoy" o "Fëdor Dostoevskij" / "Fyodor Dostoevsky" stanno intorno a 0.6
+DUPLICATE_SIMILARITY = 0.55
+_NON_ALNUM = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_name(text):
+    """Minuscolo (casefold), senza accenti, underscore e punteggiatura ridotti a un solo spazio."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text.replace("_", " "))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(_NON_ALNUM.sub(" ", stripped.casefold()).split())
+
+
+def trigrams(normalized, padded=True):
+    # Con gli spazi ai bordi anche i nomi di due lettere hanno almeno un trigramma
+    text = f"  {normalized} " if padded else normalized
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex:
+    """
+    Indice per nome normalizzato, slug normalizzato, QID Wikidata e trigrammi del nome.
+    Gli id sono quelli del LibraryStore (o qualsiasi chiave scelta da chi lo usa).
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.slugs = {}
+        self.qids = {}
+        self.grams = {}
+        self.normalized = {}
+        self.deaths = {}
+
+    def add(self, rid, record):
+        name = normalize_name(record.get("name", ""))
+        self.normalized[rid] = name
+        self.deaths[rid] = record.get("deathDate")
+        self.names.setdefault(name, set()).add(rid)
+        for slug in record.get("slugs", {}).values():
+            if slug:
+                self.slugs.setdefault(normalize_name(slug), set()).add(rid)
+        if record.get("qid"):
+            self.qids.setdefault(record["qid"], set()).add(rid)
+        for gram in trigrams(name):
+            self.grams.setdefault(gram, set()).add(rid)
+
+    def remove(self, rid, record):
+        name = self.normalized.pop(rid, normalize_name(record.get("name", "")))
+        self.deaths.pop(rid, None)
+        self.names.get(name, set()).discard(rid)
+        for slug in record.get("slugs", {}).values():
+            if slug: self.slugs.get(normalize_name(slug), set()).discard(rid)
+        if record.get("qid"):
+            self.qids.get(record["qid"], set()).discard(rid)
+        for gram in trigrams(name):
+            self.grams.get(gram, set()).discard(rid)
+
+    def find_name(self, name):
+        return set(self.names.get(normalize_name(name), set()))
+
+    def find_slug(self, slug):
+        return set(self.slugs.get(normalize_name(slug), set())) if slug else set()
+
+    def find_qid(self, qid):
+        return set(self.qids.get(qid, set())) if qid else set()
+
+    def similar(self, name, threshold=SIMILARITY):
+        """Schede con nome simile (coefficiente di Dice sui trigrammi), come lista di (punteggio, id) dal più simile."""
+        query = normalize_name(name)
+        counts = {}
+        for gram in trigrams(query):
+            for rid in self.grams.get(gram, ()):
+                counts[rid] = counts.get(rid, 0) + 1
+        size = len(trigrams(query))
+        matches = []
+        for rid, shared in counts.items():
+            # I trigrammi condivisi sono già contati: il coefficiente di Dice si ottiene senza intersezioni
+            score = 2 * shared / (size + len(trigrams(self.normalized[rid])))
+            if score >= threshold:
+                matches.append((score, rid))
+        return sorted(matches, key=lambda m: (-m[0], m[1]))
+
+    def contains(self, text):
+        """True se un nome contiene `text` (normalizzato): usa i trigrammi per scegliere chi verificare."""
+        query = normalize_name(text)
+        if not query:
+            return bool(self.normalized)
+        if len(query) < 3:
+            return any(query in name for name in self.normalized.values())
+        # Si parte dal trigramma più raro: le intersezioni restano piccole
+        postings = sorted((self.grams.get(g, set()) for g in trigrams(query, padded=False)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return False
+        return any(query in self.normalized[rid] for rid in candidates)
+
+    def find_duplicate(self, record, match_name=False):
+        """
+        Cerca una scheda che rappresenta la stessa persona: stesso QID, oppure uno slug uguale
+        a meno di accenti, maiuscole e underscore, oppure stesso nome normalizzato. Il nome da solo
+        basta solo con `match_name`; altrimenti serve anche la stessa data di morte, per non
+        confondere due omonimi. Infine un nome simile (trigrammi, DUPLICATE_SIMILARITY) con la
+        stessa data di morte: è il caso della stessa persona col titolo italiano e con quello
+        inglese, quando la scheda esistente non ha un QID. Restituisce un id oppure None.
+        """
+        same_qid = self.find_qid(record.get("qid"))
+        if same_qid:
+            return min(same_qid)
+        for slug in record.get("slugs", {}).values():
+            same_slug = self.find_slug(slug)
+            if same_slug:
+                return min(same_slug)
+        same_name = sorted(self.find_name(record.get("name", "")))
+        if match_name and same_name:
+            return same_name[0]
+        death = record.get("deathDate")
+        if not death:
+            return None
+        same_death = next((rid for rid in same_name if self.deaths.get(rid) == death), None)
+        if same_death is not None:
+            return same_death
+        return next((rid for _, rid in self.similar(record.get("name", ""), DUPLICATE_SIMILARITY) if self.deaths.get(rid) == death), None)
@@ -1,121 +1,217 @@
-import requests
 import json
 import os
 import sys
 import urllib.parse
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics_log import parse_view, record_views
+import http_client
+import metrics
+from fetch_engine import parallel_map
+from library_store import LibraryStore
+from summary_cache import SummaryUnavailable, fetch_summary
+from wikidata_batch import resolve_slugs
 
 JSON_FILE = "library.json"
-ANALYTICS_FILE = "analytics.json"
+
+# Comandi riconosciuti nei titoli dei ticket
+COMMAND_PREFIXES = ("VIEW: ", "APPROVE_BULK: ", "DELETE_BULK: ", "APPROVE: ", "DELETE: ", "ADMIN_REQUEST: ", "USER_REQUEST: ")
 
 HEADERS = {
     'User-Agent': 'iMissYouApp_Core/10.2 (https://github.com/Gimmons1)',
     'Accept': 'application/json'
 }
 
+class SearchUnavailable(Exception):
+    """La ricerca su Wikipedia non ha risposto: il comando va rimandato, non chiuso."""
+
+# In modalità batch più richieste possono cercare lo stesso nome: la ricerca si fa una volta sola.
+# Si memorizzano solo le ricerche riuscite, così un errore di rete non resta per tutto il batch
+_search_cache = {}
+
 def search_wikipedia_titles(query, lang="it"):
-    url = f"https://{lang}.wikipedia.org/w/api.php?action=query&list=search&srsearch={urllib.parse.quote(query)}&utf8=&format=json&srlimit=8"
-    titles = []
+    if (query, lang) in _search_cache:
+        return _search_cache[(query, lang)]
+    url = http_client.wikipedia_url(lang, f"/w/api.php?action=query&list=search&srsearch={urllib.parse.quote(query)}&utf8=&format=json&srlimit=8")
     try:
-        res = requests.get(url, headers=HEADERS, timeout=5)
-        if res.status_code == 200:
-            for item in res.json().get("query", {}).get("search", []): titles.append(item["title"])
-    except: pass
+        res = http_client.get(url, headers=HEADERS, timeout=5)
+        if res.status_code != 200:
+            raise SearchUnavailable(f"ricerca [{lang}] {query}: HTTP {res.status_code}")
+        titles = tuple(item["title"] for item in res.json().get("query", {}).get("search", []))
+    except SearchUnavailable:
+        raise
+    except Exception as e:
+        raise SearchUnavailable(f"ricerca [{lang}] {query}: {e}") from e
+    _search_cache[(query, lang)] = titles
     return titles
 
 def fetch_wikipedia_data(name, lang="it"):
-    slug = name.replace(' ', '_')
-    url = f"https://{lang}.wikipedia.org/api/rest_v1/page/summary/{urllib.parse.quote(slug)}"
-    try:
-        res = requests.get(url, headers=HEADERS, timeout=10)
-        if res.status_code == 200:
-            data = res.json()
-            if "extract" in data and len(data["extract"]) > 30 and data.get("type") != "disambiguation": return data
-    except: pass
+    data = fetch_summary(name.replace(' ', '_'), lang, headers=HEADERS, timeout=10)
+    if data and "extract" in data and len(data["extract"]) > 30: return data
     return None
 
+def fetch_wikidata_dates_batch(slugs, lang="it"):
+    # Una sola query SPARQL (a blocchi) per tutti i candidati, invece di una per titolo.
+    # Insieme alle date arriva il QID, che identifica la persona anche tra titoli IT ed EN diversi
+    dates = {}
+    for slug, facts in resolve_slugs(slugs, lang=lang).items():
+        dates[slug] = (facts["birthDate"] or "1000-01-01", facts["deathDate"], facts["qid"])
+    return dates
+
 def fetch_wikidata_dates(slug, lang="it"):
-    wiki_url = f"https://{lang}.wikipedia.org/wiki/{urllib.parse.quote(slug)}"
-    query = f"""
-    SELECT ?birthDate ?deathDate WHERE {{
-      <{wiki_url}> schema:about ?item .
-      OPTIONAL {{ ?item wdt:P569 ?birthDate . }}
-      OPTIONAL {{ ?item wdt:P570 ?deathDate . }}
-    }} LIMIT 1
+    return fetch_wikidata_dates_batch([slug], lang).get(slug, ("1000-01-01", None, None))
+
+def find_existing(store, name, slug, qid=None, death=None):
+    # Stessa persona se coincidono QID, slug o nome (a meno di accenti, maiuscole e underscore),
+    # oppure con la data di morte nota se il nome è molto simile (titolo IT contro titolo EN)
+    return store.find_duplicate({"name": name, "slugs": {"IT": slug}, "qid": qid, "deathDate": death}, match_name=True)
+
+def fetch_candidate(title):
+    return fetch_wikipedia_data(title, "it") or fetch_wikipedia_data(title, "en")
+
+def resolve_candidates(name_query, store):
+    """
+    Trova i candidati per una richiesta con una pipeline parallela: le due ricerche (it, en) e la
+    risoluzione del nome esatto partono insieme, i riassunti dei candidati si scaricano in parallelo
+    e le date arrivano da Wikidata con una sola query. Restituisce ([(titolo, dati)], {slug: (nascita, morte)}).
+    Se il nome esatto corrisponde a una persona scomparsa non ancora in biblioteca, ci si ferma lì:
+    gli altri risultati della ricerca servirebbero solo come ripiego.
     """
+    def resolve_exact():
+        data = fetch_candidate(name_query)
+        if not data:
+            return None, None
+        slug = data.get("titles", {}).get("canonical", name_query)
+        return data, fetch_wikidata_dates(slug)
+
+    # Niente `with`: uscendo dal blocco si aspetterebbero comunque le ricerche ormai inutili
+    executor = ThreadPoolExecutor(max_workers=3)
     try:
-        res = requests.get("https://query.wikidata.org/sparql", params={'query': query, 'format': 'json'}, headers=HEADERS, timeout=10)
-        if res.status_code == 200:
-            bindings = res.json()['results']['bindings']
-            if bindings:
-                b_raw = bindings[0].get('birthDate', {}).get('value', '1000-01-01')
-                d_raw = bindings[0].get('deathDate', {}).get('value')
-                return b_raw.split('T')[0].replace('+', ''), d_raw.split('T')[0].replace('+', '') if d_raw else None
-    except: pass
-    return "1000-01-01", None
+        search_it = executor.submit(search_wikipedia_titles, name_query, "it")
+        search_en = executor.submit(search_wikipedia_titles, name_query, "en")
+        exact = executor.submit(resolve_exact)
 
-def run_processor():
-    issue_title = os.environ.get("ISSUE_TITLE", "")
-    if not issue_title: return
+        exact_data, exact_dates = exact.result()
+        if exact_data and exact_dates[1]:
+            slug = exact_data.get("titles", {}).get("canonical", name_query)
+            if find_existing(store, exact_data.get("title", name_query).replace("_", " "), slug, exact_dates[2], exact_dates[1]) is None:
+                return [(name_query, exact_data)], {slug: exact_dates}
+
+        candidates = list(search_it.result() + search_en.result())
+    finally:
+        # Le ricerche non ancora partite si annullano, quelle in corso finiscono da sole (Python 3.9+)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Il nome esatto è già stato scaricato: gli altri titoli partono tutti insieme
+    others = [t for t in set(candidates) if t != name_query]
+    resolved = parallel_map(fetch_candidate, others)
+    found = [(t, data) for t, data in zip(others, resolved) if data]
+    if exact_data:
+        found.insert(0, (name_query, exact_data))
+    # Le date di tutti i candidati arrivano da Wikidata in un colpo solo
+    all_dates = fetch_wikidata_dates_batch([d.get("titles", {}).get("canonical", t) for t, d in found])
+    return found, all_dates
+
+def is_command(title):
+    return title.startswith(COMMAND_PREFIXES)
+
+def load_commands(path):
+    return [ticket["title"] for ticket in load_tickets(path)]
+
+def load_tickets(path):
+    """
+    Legge i comandi in attesa da un file: un array JSON di ticket ({"number", "title"},
+    come quello prodotto da `gh issue list --json number,title`), un file JSONL con il campo
+    "title" (come la coda requests.jsonl) oppure un titolo per riga. Restituisce
+    [{"number", "title"}], con number None quando il file non lo indica.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read()
+    try:
+        items = json.loads(raw)
+        if isinstance(items, list):
+            # gh elenca i ticket dal più recente: si applicano nell'ordine di apertura
+            items = sorted(items, key=lambda i: i.get("number", 0))
+            return [{"number": i.get("number"), "title": i["title"]} for i in items if is_command(i.get("title", ""))]
+    except ValueError:
+        pass
+    commands = []
+    for line in raw.splitlines():
+        line = line.strip()
+        if not line: continue
+        if line.startswith("{"):
+            try: line = json.loads(line).get("title", "")
+            except ValueError: continue
+        if is_command(line): commands.append({"number": None, "title": line})
+    return commands
 
+def run_batch(commands):
+    """
+    Applica molti comandi in ordine con un solo caricamento della biblioteca e un solo salvataggio:
+    ogni comando finisce nel diario, la compattazione avviene una volta alla fine.
+    Restituisce per ogni comando True se è stato eseguito, False se è stato rimandato.
+    """
+    done = [is_command(command) for command in commands]
     # 1. GESTIONE ANALYTICS (Tracciamento del tempo)
-    if issue_title.startswith("VIEW: "):
-        # Il formato in arrivo dall'app è: "VIEW: Nome | Secondi"
-        parts = issue_title.replace("VIEW: ", "").split("|")
-        viewed_name = parts[0].strip()
-        duration = int(parts[1].strip()) if len(parts) > 1 and parts[1].strip().isdigit() else 0
-        
-        print(f"📊 Registrazione per: {viewed_name} (Tempo: {duration}s)")
-        
-        analytics = {}
-        if os.path.exists(ANALYTICS_FILE):
-            try:
-                with open(ANALYTICS_FILE, "r", encoding="utf-8") as f:
-                    analytics = json.load(f)
-            except: pass
-            
-        # Retrocompatibilità se il file è vecchio
-        if viewed_name in analytics and isinstance(analytics[viewed_name], int):
-            old_views = analytics[viewed_name]
-            analytics[viewed_name] = {"views": old_views, "time": 0}
-            
-        if viewed_name not in analytics:
-            analytics[viewed_name] = {"views": 0, "time": 0}
-            
-        # Aggiorna i contatori
-        analytics[viewed_name]["views"] += 1
-        analytics[viewed_name]["time"] += duration
-        
-        with open(ANALYTICS_FILE, "w", encoding="utf-8") as f:
-            json.dump(analytics, f, indent=2, ensure_ascii=False)
-        print("📊 Analytics salvate con successo.")
-        return 
+    views = []
+    for command in commands:
+        if command.startswith("VIEW: "):
+            # Il formato in arrivo dall'app è: "VIEW: Nome | Secondi"
+            viewed_name, duration = parse_view(command)
+            print(f"📊 Registrazione per: {viewed_name} (Tempo: {duration}s)")
+            views.append((viewed_name, duration))
+    if views:
+        # Tutte le visualizzazioni in un solo segmento: i totali in analytics.json
+        # vengono ricalcolati periodicamente da analytics_log.py reduce
+        record_views(views)
+        print(f"📊 Analytics salvate con successo ({len(views)} visualizzazioni).")
 
     # 2. GESTIONE DATABASE TRADIZIONALE
-    library = []
-    if os.path.exists(JSON_FILE):
-        with open(JSON_FILE, "r", encoding="utf-8") as f:
-            try: library = json.load(f)
-            except: pass
-    
+    library_commands = [(i, c) for i, c in enumerate(commands) if is_command(c) and not c.startswith("VIEW: ")]
+    metrics.set_value("visualizzazioni", len(views))
+    metrics.set_value("comandi biblioteca", len(library_commands))
+    if not library_commands:
+        return done
+    with metrics.timer("fase.caricamento"):
+        store = LibraryStore()
+    for i, command in library_commands:
+        print(f"⚙️ Comando: {command}")
+        # Tempo per tipo di comando (APPROVE, USER_REQUEST, ...)
+        with metrics.timer(f"comando.{command.split(':', 1)[0]}"):
+            try:
+                process_library_command(store, command)
+            except (SummaryUnavailable, SearchUnavailable) as e:
+                # Wikipedia non ha risposto: meglio rimandare che registrare un falso "nessuna corrispondenza"
+                print(f"⚠️ Comando rimandato, Wikipedia non raggiungibile ({e}).")
+                metrics.incr("comandi", "rimandati")
+                done[i] = False
+    metrics.set_value("schede esaminate", len(store))
+    metrics.set_value("schede modificate", len(store.touched | store.removed))
+    # I comandi sono già nel diario: si registra la versione e library.json si riscrive una volta
+    # a fine batch, così le azioni degli admin arrivano subito ai client
+    with metrics.timer("fase.salvataggio"):
+        store.commit()
+    http_client.print_failure_report()
+    return done
+
+def run_processor():
+    issue_title = os.environ.get("ISSUE_TITLE", "")
+    if not issue_title: return
+    run_batch([issue_title])
+
+def process_library_command(store, issue_title):
     if issue_title.startswith("APPROVE_BULK: "):
         names = [n.strip().lower() for n in issue_title.replace("APPROVE_BULK: ", "").split("|")]
-        for p in library:
-            if p["name"].lower() in names: p["approved"] = True
-        with open(JSON_FILE, "w", encoding="utf-8") as f: json.dump(library, f, indent=2, ensure_ascii=False)
+        for name in set(names): store.approve(name)
+        store.save()
         return
 
     if issue_title.startswith("DELETE_BULK: "):
         names = [n.strip().lower() for n in issue_title.replace("DELETE_BULK: ", "").split("|")]
-        new_library = []
-        for p in library:
-            name_lower = p["name"].lower()
-            if name_lower in names:
-                names.remove(name_lower) # Rimuove solo un'istanza alla volta dalla lista di bersagli
-                continue
-            new_library.append(p)
-        library = new_library
-        with open(JSON_FILE, "w", encoding="utf-8") as f: json.dump(library, f, indent=2, ensure_ascii=False)
+        # Ogni nome ripetuto nella lista elimina una sola istanza alla volta
+        for name in set(names): store.delete_by_name(name, count=names.count(name))
+        store.save()
         return
 
     prefix = ""
@@ -123,54 +219,56 @@ def run_processor():
     elif issue_title.startswith("USER_REQUEST: "): prefix = "USER_REQUEST: "
     elif issue_title.startswith("APPROVE: "):
         name_to_approve = issue_title.replace("APPROVE: ", "").strip()
-        for p in library:
-            if p["name"].lower() == name_to_approve.lower(): p["approved"] = True
-        with open(JSON_FILE, "w", encoding="utf-8") as f: json.dump(library, f, indent=2, ensure_ascii=False)
+        store.approve(name_to_approve)
+        store.save()
         return
     elif issue_title.startswith("DELETE: "):
         name_to_delete = issue_title.replace("DELETE: ", "").strip()
-        new_library = []
-        deleted = False
-        for p in library:
-            # Se trova una corrispondenza e non l'ha ancora cancellata, la salta (quindi la elimina)
-            if not deleted and p["name"].lower() == name_to_delete.lower():
-                deleted = True 
-                continue
-            new_library.append(p)
-        library = new_library
-        with open(JSON_FILE, "w", encoding="utf-8") as f: json.dump(library, f, indent=2, ensure_ascii=False)
+        # Elimina solo la prima corrispondenza nella timeline
+        store.delete_by_name(name_to_delete, count=1)
+        store.save()
         return
     
     if prefix:
         name_query = issue_title.replace(prefix, "").strip()
-        candidates = search_wikipedia_titles(name_query, "it") + search_wikipedia_titles(name_query, "en")
-        unique_titles = list(set([name_query] + candidates))
+        found, all_dates = resolve_candidates(name_query, store)
         added_count = 0
         
-        for t in unique_titles:
-            data = fetch_wikipedia_data(t, "it") or fetch_wikipedia_data(t, "en")
-            if not data: continue
+        for t, data in found:
             real_name = data.get("title", t).replace("_", " ")
             slug = data.get("titles", {}).get("canonical", t)
             
-            if any(p["name"].lower() == real_name.lower() for p in library): continue
-            birth, death = fetch_wikidata_dates(slug)
+            birth, death, qid = all_dates.get(slug, ("1000-01-01", None, None))
+            if find_existing(store, real_name, slug, qid, death) is not None: continue
             
             if not death:
                 if t.lower() == name_query.lower():
-                    library.append({"name": f"⛔ ANCORA IN VITA: {real_name}", "slugs": {"IT": "", "EN": ""}, "bio": "Questa persona risulta essere ancora in vita.", "birthDate": birth, "deathDate": datetime.now().strftime("%Y-%m-%d"), "approved": False})
+                    store.add({"name": f"⛔ ANCORA IN VITA: {real_name}", "slugs": {"IT": "", "EN": ""}, "bio": "Questa persona risulta essere ancora in vita.", "birthDate": birth, "deathDate": datetime.now().strftime("%Y-%m-%d"), "approved": False})
                 continue
                 
-            library.append({"name": real_name, "slugs": {"IT": slug, "EN": slug}, "bio": data.get("extract", "Biografia non disponibile."), "birthDate": birth, "deathDate": death, "imageUrl": data.get("originalimage", {}).get("source"), "approved": "ADMIN" in prefix})
+            record = {"name": real_name, "slugs": {"IT": slug, "EN": slug}, "bio": data.get("extract", "Biografia non disponibile."), "birthDate": birth, "deathDate": death, "imageUrl": data.get("originalimage", {}).get("source"), "approved": "ADMIN" in prefix}
+            if qid: record["qid"] = qid
+            store.add(record)
             added_count += 1
             
-        if added_count > 0:
-            library.sort(key=lambda x: x['deathDate'])
-            with open(JSON_FILE, "w", encoding="utf-8") as f: json.dump(library, f, indent=2, ensure_ascii=False)
-        else:
-            if not any(name_query.lower() in p["name"].lower() for p in library):
-                library.append({"name": f"⚠️ ERRORE: {name_query}", "slugs": {"IT": "", "EN": ""}, "bio": "Nessuna corrispondenza trovata.", "birthDate": "1000-01-01", "deathDate": datetime.now().strftime("%Y-%m-%d"), "approved": False})
-                with open(JSON_FILE, "w", encoding="utf-8") as f: json.dump(library, f, indent=2, ensure_ascii=False)
+        if added_count == 0:
+            # Ricerca per trigrammi invece di scorrere tutti i nomi
+            if not store.mentions(name_query):
+                store.add({"name": f"⚠️ ERRORE: {name_query}", "slugs": {"IT": "", "EN": ""}, "bio": "Nessuna corrispondenza trovata.", "birthDate": "1000-01-01", "deathDate": datetime.now().strftime("%Y-%m-%d"), "approved": False})
+        store.save()
 
 if __name__ == "__main__":
-    run_processor()
+    metrics.start_run("request_processor")
+    # python request_processor.py --batch pending_issues.json [processed_issues.txt]
+    if len(sys.argv) > 2 and sys.argv[1] == "--batch":
+        tickets = load_tickets(sys.argv[2])
+        print(f"Elaborazione di {len(tickets)} comandi in attesa...")
+        done = run_batch([ticket["title"] for ticket in tickets])
+        if len(sys.argv) > 3:
+            # Solo i ticket eseguiti si chiudono: quelli rimandati restano aperti per il prossimo giro
+            with open(sys.argv[3], "w", encoding="utf-8") as f:
+                for ticket, ok in zip(tickets, done):
+                    if ok and ticket["number"] is not None:
+                        f.write(f"{ticket['number']}\n")
+    else:
+        run_processor()
@@ -0,0 +1,173 @@
+import bisect
+import json
+import math
+import sys
+
+from name_index import normalize_name
+
+# Indice di ricerca a testo pieno su nome, causa del decesso e biografia, pubblicato in dist/search.json.
+# Le parole passano dalla stessa normalizzazione dei nomi (minuscolo, senza accenti), si tolgono
+# le parole vuote italiane e inglesi e per ogni termine si salvano le schede che lo contengono
+# come differenze tra id consecutivi (interi piccoli, che compressi pesano pochissimo),
+# insieme alle frequenze pesate che servono al punteggio BM25.
+SEARCH_FILE = "search.json"
+FORMAT_VERSION = 1
+CAUSE_PREFIX = "⚕️ Causa del decesso:"
+# Peso di ogni campo nella frequenza dei termini: una parola nel nome conta più di una nella bio
+FIELD_WEIGHTS = {"name": 3, "cause": 2, "bio": 1}
+BM25_K1 = 1.2
+BM25_B = 0.75
+MIN_TOKEN = 2
+
+STOPWORDS = set("""
+il lo la i gli le un una uno di del dello della dei degli delle a al allo alla ai agli alle da dal dallo
+dalla dai dagli dalle in nel nello nella nei negli nelle su sul sullo sulla sui sugli sulle con per tra fra
+ed o ma se che chi cui non come anche piu dove quando dopo prima era erano fu furono stato stata sono
+essere ha hanno aveva avevano suo sua suoi sue loro questo questa quello quella dell dall nell sull all quest
+the an of and or to in on at by for with from as is was were be been has had have his her its their this
+that which who it he she they also after before into than
+""".split())
+
+
+def tokenize(text):
+    """Parole normalizzate: "Morì nell'ospedale di Città" -> ["mori", "ospedale", "citta"]."""
+    return [t for t in normalize_name(text).split() if len(t) >= MIN_TOKEN and t not in STOPWORDS]
+
+
+def record_fields(record):
+    # La riga della causa aggiunta da bio_updater diventa un campo a sé
+    bio = record.get("bio", "") or ""
+    cause = ""
+    if bio.startswith(CAUSE_PREFIX):
+        first, _, rest = bio.partition("\n\n")
+        cause, bio = first[len(CAUSE_PREFIX):].strip(" ."), rest
+    return {"name": record.get("name", ""), "cause": cause, "bio": bio}
+
+
+def delta_encode(numbers):
+    previous = 0
+    encoded = []
+    for number in numbers:
+        encoded.append(number - previous)
+        previous = number
+    return encoded
+
+
+def delta_decode(deltas):
+    total = 0
+    decoded = []
+    for delta in deltas:
+        total += delta
+        decoded.append(total)
+    return decoded
+
+
+def build_index(library):
+    """
+    Indice della biblioteca già in ordine di timeline. Nelle liste i documenti sono numeri
+    progressivi (piccoli e adatti alle differenze); "ids" li traduce nell'uid della scheda,
+    lo stesso "id" di dist/index.json, così il client risale subito alla scheda.
+    """
+    postings = {}
+    lengths = []
+    for doc_id, record in enumerate(library):
+        frequencies = {}
+        length = 0
+        for field, text in record_fields(record).items():
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                frequencies[token] = frequencies.get(token, 0) + weight
+                length += weight
+        lengths.append(length)
+        for token, frequency in frequencies.items():
+            postings.setdefault(token, []).append((doc_id, frequency))
+
+    terms = {}
+    for token in sorted(postings):
+        entries = postings[token]
+        # [frequenza documentale, id come differenze, frequenze pesate]
+        terms[token] = [len(entries), delta_encode([d for d, _ in entries]), [f for _, f in entries]]
+    return {
+        "version": FORMAT_VERSION,
+        "docs": len(library),
+        "ids": [record["uid"] for record in library],
+        "averageLength": round(sum(lengths) / len(lengths), 3) if lengths else 0,
+        "k1": BM25_K1,
+        "b": BM25_B,
+        "fieldWeights": FIELD_WEIGHTS,
+        "lengths": lengths,
+        "terms": terms,
+    }
+
+
+class SearchIndex:
+    """Ricerca sull'indice già costruito: si decodificano solo le liste dei termini cercati."""
+
+    def __init__(self, data):
+        self.data = data
+        self.terms = data["terms"]
+        self.sorted_terms = sorted(self.terms)
+        self.lengths = data["lengths"]
+        self.ids = data["ids"]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def postings(self, term):
+        entry = self.terms.get(term)
+        if not entry:
+            return []
+        return list(zip(delta_decode(entry[1]), entry[2]))
+
+    def expand(self, prefix, limit=20):
+        # Termini che iniziano con il prefisso: per chi sta ancora scrivendo l'ultima parola
+        start = bisect.bisect_left(self.sorted_terms, prefix)
+        found = []
+        for term in self.sorted_terms[start:]:
+            if not term.startswith(prefix) or len(found) >= limit:
+                break
+            found.append(term)
+        return found
+
+    def idf(self, term):
+        docs, df = self.data["docs"], self.terms[term][0]
+        return math.log(1 + (docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query, limit=10, prefix=True):
+        """
+        Schede ordinate per punteggio BM25: [(uid, punteggio)]. Con `prefix` l'ultima parola
+        vale anche come inizio di parola ("monr" trova "monroe").
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        k1, b = self.data["k1"], self.data["b"]
+        average = self.data["averageLength"] or 1
+        scores = {}
+        for position, token in enumerate(tokens):
+            variants = [token]
+            if prefix and position == len(tokens) - 1:
+                variants = self.expand(token) or variants
+            for term in variants:
+                if term not in self.terms:
+                    continue
+                idf = self.idf(term)
+                for doc_id, frequency in self.postings(term):
+                    norm = k1 * (1 - b + b * self.lengths[doc_id] / average)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (k1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.ids[doc_id], round(score, 4)) for doc_id, score in ranked[:limit]]
+
+
+if __name__ == "__main__":
+    # python search_index.py "attore infarto" [--index dist/search.json]
+    from library_store import LibraryStore
+    path = sys.argv[sys.argv.index("--index") + 1] if "--index" in sys.argv else f"dist/{SEARCH_FILE}"
+    words = [a for i, a in enumerate(sys.argv[1:], 1) if a != "--index" and sys.argv[i - 1] != "--index"]
+    index = SearchIndex.load(path)
+    library = {record["uid"]: record for record in LibraryStore().to_list()}
+    for uid, score in index.search(" ".join(words)):
+        record = library.get(uid, {})
+        print(f"{score:8.3f}  {record.get('name', uid)} ({record.get('deathDate', '')})")
@@ -0,0 +1,144 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+import http_client
+import metrics
+
+# Cache persistente dei riassunti di Wikipedia (/api/rest_v1/page/summary/{slug}).
+# Il file viene conservato tra un'esecuzione e l'altra tramite la cache delle GitHub Actions.
+CACHE_FILE = os.environ.get("SUMMARY_CACHE_FILE", ".cache/wiki_summaries.sqlite")
+# Dopo quanto tempo una risposta va riconvalidata con il server (If-None-Match)
+CACHE_TTL = int(os.environ.get("SUMMARY_CACHE_TTL", 7 * 24 * 3600))
+# Le pagine inesistenti o di disambiguazione si ricontrollano più spesso
+NEGATIVE_TTL = int(os.environ.get("SUMMARY_CACHE_NEGATIVE_TTL", 24 * 3600))
+# Numero massimo di voci: oltre questa soglia si eliminano le meno usate di recente
+MAX_ENTRIES = int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", 50000))
+
+_lock = threading.Lock()
+_conn = None
+
+
+class SummaryUnavailable(Exception):
+    """Il riassunto non è arrivato (errore di rete, 429/5xx) e in cache non ce n'è una copia."""
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        folder = os.path.dirname(CACHE_FILE)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        _conn = sqlite3.connect(CACHE_FILE, check_same_thread=False)
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                lang TEXT NOT NULL,
+                slug TEXT NOT NULL,
+                body TEXT,
+                etag TEXT,
+                fetched_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (lang, slug)
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used)")
+        _conn.commit()
+    return _conn
+
+
+def _read(lang, slug):
+    with _lock:
+        row = _db().execute(
+            "SELECT body, etag, fetched_at FROM summaries WHERE lang = ? AND slug = ?", (lang, slug)
+        ).fetchone()
+        if row:
+            _db().execute("UPDATE summaries SET last_used = ? WHERE lang = ? AND slug = ?", (time.time(), lang, slug))
+            _db().commit()
+        return row
+
+
+def _write(lang, slug, body, etag):
+    now = time.time()
+    with _lock:
+        db = _db()
+        db.execute(
+            "INSERT OR REPLACE INTO summaries (lang, slug, body, etag, fetched_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (lang, slug, body, etag, now, now),
+        )
+        # Limite LRU: via le voci usate meno di recente
+        excess = db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0] - MAX_ENTRIES
+        if excess > 0:
+            db.execute(
+                "DELETE FROM summaries WHERE rowid IN (SELECT rowid FROM summaries ORDER BY last_used LIMIT ?)", (excess,)
+            )
+        db.commit()
+
+
+def _is_usable(data):
+    # Le pagine di disambiguazione non descrivono una persona: le trattiamo come mancanti
+    return data is not None and "disambiguation" not in data.get("type", "")
+
+
+def peek_summary(slug, lang="it"):
+    """Legge il riassunto dalla cache locale senza toccare la rete (None se non c'è)."""
+    row = _read(lang, slug.replace(' ', '_'))
+    return json.loads(row[0]) if row and row[0] else None
+
+
+def fetch_summary(slug, lang="it", headers=None, timeout=5):
+    """
+    Restituisce il riassunto Wikipedia (dict) di `slug` nella lingua `lang`, oppure None se la pagina
+    non esiste o è una disambiguazione. Usa la cache locale finché è fresca, poi riconvalida con l'ETag.
+    Se il server non risponde (errore di rete, 429, 5xx) si usa la copia scaduta; senza copia
+    solleva SummaryUnavailable, perché "pagina inesistente" e "server irraggiungibile" non sono
+    la stessa cosa per chi chiama. Gli altri 4xx valgono come pagina inesistente.
+    """
+    slug = slug.replace(' ', '_')
+    row = _read(lang, slug)
+    cached = json.loads(row[0]) if row and row[0] else None
+
+    if row:
+        ttl = CACHE_TTL if cached is not None else NEGATIVE_TTL
+        if time.time() - row[2] < ttl:
+            metrics.incr("cache.summary", "hit")
+            return cached
+
+    request_headers = dict(headers or {})
+    if row and row[1]:
+        request_headers["If-None-Match"] = row[1]
+
+    url = http_client.wikipedia_url(lang, f"/api/rest_v1/page/summary/{urllib.parse.quote(slug)}")
+    try:
+        res = http_client.get(url, headers=request_headers, timeout=timeout)
+    except Exception as e:
+        print(f"Errore recupero riassunto [{lang}] {slug}: {e}")
+        if not row:
+            raise SummaryUnavailable(f"[{lang}] {slug}: {e}") from e
+        metrics.incr("cache.summary", "stale")
+        # Meglio una risposta vecchia che nessuna risposta
+        return cached
+
+    if res.status_code == 304 and row:
+        metrics.incr("cache.summary", "revalidated")
+        _write(lang, slug, row[0], row[1])
+        return cached
+    metrics.incr("cache.summary", "miss")
+    if res.status_code == 200:
+        data = res.json()
+        if not _is_usable(data):
+            _write(lang, slug, None, res.headers.get("ETag"))
+            return None
+        _write(lang, slug, json.dumps(data, ensure_ascii=False), res.headers.get("ETag"))
+        return data
+    if 400 <= res.status_code < 500 and res.status_code != 429:
+        # 404, ma anche 400 (titolo non valido) o 403: riprovare subito non cambierebbe la risposta
+        _write(lang, slug, None, None)
+        return None
+
+    # Errori temporanei (429, 5xx): non si memorizza nulla
+    if not row and (res.status_code == 429 or res.status_code >= 500):
+        raise SummaryUnavailable(f"[{lang}] {slug}: HTTP {res.status_code}")
+    return cached
@@ -1,53 +1,73 @@
-import requests
 import json
 import os
-import time
 import urllib.parse
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+import http_client
+import metrics
+from library_store import LibraryStore
+from name_index import NameIndex
+from summary_cache import SummaryUnavailable, fetch_summary
 
 JSON_FILE = "library.json"
-SPARQL_URL = "https://query.wikidata.org/sparql"
+SPARQL_URL = http_client.SPARQL_URL
+# Segnalibro del radar: ultima data di morte e ultima modifica Wikidata già viste, più il punto
+# di ripresa (resumeDeath/resumeSince) quando una passata si ferma a MAX_PAGES
+STATE_FILE = "radar_state.json"
+WINDOW_DAYS = 365
+# Le modifiche arrivano su Wikidata (e nel servizio SPARQL) con qualche ritardo: si riguarda un po' indietro
+OVERLAP = timedelta(hours=48)
+PAGE_SIZE = 50
+MAX_PAGES = 40
 # Fonti certificate e affidabili (Wikidata)
 HEADERS = {
     'User-Agent': 'iMissYouApp_RecentSentinel/7.0 (https://github.com/Gimmons1)',
     'Accept': 'application/sparql-results+json'
 }
 
+@metrics.timed("fase.biografie")
 def get_wikipedia_bio(slug, lang="it"):
-    url = f"https://{lang}.wikipedia.org/api/rest_v1/page/summary/{urllib.parse.quote(slug)}"
     try:
-        response = requests.get(url, headers=HEADERS, timeout=(5, 5))
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("titles", {}).get("canonical", slug), data.get("extract", "")
-    except:
-        pass
+        data = fetch_summary(slug, lang, headers=HEADERS, timeout=(5, 5))
+    except SummaryUnavailable:
+        # La pipeline di arricchimento riproverà sulle biografie rimaste corte
+        data = None
+    if data:
+        return data.get("titles", {}).get("canonical", slug), data.get("extract", "")
     return slug.replace('_', ' '), "Biografia in attesa di aggiornamento."
 
-def run_updater():
-    # Cerca nell'ultimo anno solare
-    data_limite = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%dT00:00:00Z")
-    print(f"--- Sentinel Attiva: Cerco decessi dal {data_limite[:10]} ad oggi ---")
-    
-    if os.path.exists(JSON_FILE):
-        with open(JSON_FILE, "r", encoding="utf-8") as f:
-            try: library = json.load(f)
-            except: library = []
-    else:
-        library = []
+def load_state(path=STATE_FILE):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            try: return json.load(f)
+            except: pass
+    return {}
 
-    existing_slugs = set()
-    for p in library:
-        for val in p.get("slugs", {}).values():
-            existing_slugs.add(val.lower())
+def save_state(state, path=STATE_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp_path, path)
 
-    new_entries = []
+def iso(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def mark_since(state, key, floor):
+    # Da dove ripartire: il segnalibro meno la sovrapposizione, mai prima dell'inizio della finestra
+    if not state.get(key):
+        return floor
+    return max(floor, iso(datetime.strptime(state[key], "%Y-%m-%dT%H:%M:%SZ") - OVERLAP))
 
-    query = f"""
-    SELECT ?person ?personLabel ?birthDate ?deathDate ?image ?sitelinks ?article WHERE {{
+def build_query(floor, death_mark, modified_mark, offset):
+    # Decessi dell'ultimo anno, ma solo quelli nuovi o modificati su Wikidata dall'ultimo segnalibro.
+    # L'ordine per data e QID non cambia da una pagina all'altra, quindi OFFSET non salta nessuno.
+    return f"""
+    SELECT ?person ?personLabel ?birthDate ?deathDate ?image ?sitelinks ?article ?modified WHERE {{
       ?person wdt:P31 wd:Q5. 
       ?person wdt:P570 ?deathDate.
-      FILTER(?deathDate >= "{data_limite}"^^xsd:dateTime)
+      FILTER(?deathDate >= "{floor}"^^xsd:dateTime)
+      ?person schema:dateModified ?modified .
+      FILTER(?deathDate >= "{death_mark}"^^xsd:dateTime || ?modified >= "{modified_mark}"^^xsd:dateTime)
       ?person wikibase:sitelinks ?sitelinks .
       FILTER(?sitelinks >= 25)
       OPTIONAL {{ ?person wdt:P569 ?birthDate. }}
@@ -58,17 +78,61 @@ def run_updater():
       }}
       SERVICE wikibase:label {{ bd:serviceParam wikibase:language "it,en". }}
     }}
-    ORDER BY DESC(?deathDate)
-    LIMIT 50
+    ORDER BY ?deathDate ?person
+    LIMIT {PAGE_SIZE} OFFSET {offset}
     """
+
+def run_updater():
+    """
+    Radar incrementale: il segnalibro in radar_state.json ricorda l'ultima data di morte e l'ultima
+    modifica Wikidata viste. Ogni esecuzione chiede solo ciò che è arrivato dopo (meno OVERLAP, per le
+    modifiche tardive) e scorre le pagine finché non ha visto tutto. Il segnalibro avanza solo se
+    la ricerca è arrivata in fondo. Se si ferma a MAX_PAGES, le pagine sono ordinate per ?deathDate:
+    si salva l'ultima data di morte vista e la prossima esecuzione riprende da lì, senza rifare
+    le pagine già scorse. Dopo un errore, invece, la prossima esecuzione riparte dallo stesso punto.
+    """
+    now = datetime.now(timezone.utc)
+    # Mai oltre l'ultimo anno solare: i decessi più vecchi li recupera l'importatore storico
+    floor = iso(now - timedelta(days=WINDOW_DAYS))
+    state = load_state()
+    death_mark = mark_since(state, "deathMark", floor)
+    modified_mark = mark_since(state, "modifiedMark", floor)
+    # Ripresa di una passata interrotta: le date di morte prima di resumeDeath sono già state viste
+    scan_floor = max(floor, state.get("resumeDeath") or floor)
+    print(f"--- Sentinel Attiva: decessi dal {death_mark[:10]} o modificati su Wikidata dal {modified_mark[:16].replace('T', ' ')} ---")
+    if scan_floor != floor:
+        print(f"🔖 Ripresa della passata interrotta dai decessi del {scan_floor[:10]}.")
     
+    # Lo store indicizza già tutti gli slug: niente più set ricostruito a ogni esecuzione
+    store = LibraryStore(JSON_FILE)
+
+    new_entries = []
+    # Indice delle schede appena trovate, per non aggiungere due volte la stessa persona
+    pending = NameIndex()
+    seen_death = seen_modified = None
+    scanned = 0
+    caught_up = False
+    truncated = False
+
     try:
-        response = requests.get(SPARQL_URL, params={'query': query}, headers=HEADERS, timeout=(10, 30))
-        if response.status_code == 200:
+        for page in range(MAX_PAGES):
+            query = build_query(scan_floor, death_mark, modified_mark, page * PAGE_SIZE)
+            with metrics.timer("fase.sparql"):
+                response = http_client.get(SPARQL_URL, params={'query': query}, headers=HEADERS, timeout=(10, 30))
+            if response.status_code != 200:
+                print(f"Errore Wikidata (HTTP {response.status_code}): il segnalibro resta dov'era.")
+                break
             results = response.json()['results']['bindings']
-            print(f" -> Trovate {len(results)} figure di spicco recenti.")
+            scanned += len(results)
             
             for item in results:
+                # Il segnalibro avanza con i dati di Wikidata, non con l'orologio del runner
+                death_value = item['deathDate']['value']
+                modified_value = item.get('modified', {}).get('value')
+                seen_death = max(seen_death or death_value, death_value)
+                if modified_value:
+                    seen_modified = max(seen_modified or modified_value, modified_value)
+
                 raw_name = item['personLabel']['value'].strip()
                 if raw_name.startswith("Q") and raw_name[1:].isdigit(): 
                     continue
@@ -76,40 +140,79 @@ def run_updater():
                 article_url = item.get('article', {}).get('value', '')
                 slug_en = article_url.split('/')[-1] if article_url else raw_name.replace(' ', '_')
                 slug_en = urllib.parse.unquote(slug_en)
-                
-                if slug_en.lower() in existing_slugs:
-                    continue
+                qid = item['person']['value'].rsplit('/', 1)[-1]
                     
                 birth = item.get('birthDate', {}).get('value', '1900-01-01T').split('T')[0]
-                death = item.get('deathDate', {}).get('value', '2024-01-01T').split('T')[0]
+                death = death_value.split('T')[0]
                 img = item.get('image', {}).get('value', None)
                 
                 clean_name = raw_name.replace('_', ' ')
+                # Doppione se esiste già lo stesso QID, lo stesso slug o lo stesso nome con la stessa data
+                candidate = {"name": clean_name, "slugs": {"EN": slug_en}, "deathDate": death, "qid": qid}
+                if store.find_duplicate(candidate) is not None or pending.find_duplicate(candidate) is not None:
+                    continue
+
                 it_slug, bio = get_wikipedia_bio(slug_en)
-                
-                new_entries.append({
+                record = {
                     "name": clean_name, 
                     "slugs": {"IT": it_slug.replace(' ', '_'), "EN": slug_en},
                     "bio": bio, # ✅ Il testo tecnico è stato rimosso. Biografia perfettamente pulita.
                     "birthDate": birth, 
                     "deathDate": death, 
                     "imageUrl": img, 
-                    "approved": False 
-                })
-                existing_slugs.add(slug_en.lower())
-                existing_slugs.add(it_slug.lower().replace(' ', '_'))
-                time.sleep(0.2)
+                    "approved": False,
+                    "qid": qid
+                }
+                # Lo slug italiano può rivelare una scheda già presente col titolo IT
+                if store.find_duplicate(record) is not None or pending.find_duplicate(record) is not None:
+                    continue
+                pending.add(len(new_entries), record)
+                new_entries.append(record)
+
+            if len(results) < PAGE_SIZE:
+                caught_up = True
+                break
+        else:
+            truncated = True
     except Exception as e:
         print(f"Errore durante la ricerca: {e}")
 
+    print(f" -> Trovate {scanned} figure di spicco nuove o modificate.")
+    metrics.set_value("figure esaminate", scanned)
+    metrics.set_value("schede in biblioteca", len(store))
+    metrics.set_value("schede aggiunte", len(new_entries))
     if new_entries:
-        library.extend(new_entries)
-        library.sort(key=lambda x: x['deathDate'])
-        with open(JSON_FILE, "w", encoding="utf-8") as f:
-            json.dump(library, f, indent=2, ensure_ascii=False)
+        # Inserimento ordinato: la timeline resta in ordine senza riordinare tutta la biblioteca
+        store.add_many(new_entries)
+        store.commit()
         print(f"--- Salvati {len(new_entries)} nuovi decessi da approvare! ---")
     else:
         print("--- Nessuna nuova aggiunta necessaria. ---")
 
+    if caught_up:
+        # Una data di morte nel futuro è un errore di Wikidata: non deve spostare il segnalibro
+        now_iso = iso(now)
+        old_modified = state.get("modifiedMark") or floor
+        modified = min(max(seen_modified or "", old_modified), now_iso)
+        if state.get("resumeSince"):
+            # Le schede morte prima del punto di ripresa sono state guardate all'inizio della passata:
+            # le loro modifiche successive vanno ricontrollate, quindi il segnalibro non le supera
+            modified = max(old_modified, min(modified, state["resumeSince"]))
+        state["deathMark"] = min(max(seen_death or "", state.get("deathMark") or floor), now_iso)
+        state["modifiedMark"] = modified
+        state["lastRun"] = now_iso
+        state.pop("resumeDeath", None)
+        state.pop("resumeSince", None)
+        save_state(state)
+    elif truncated and seen_death:
+        # Segnalibro parziale: l'ordine è ?deathDate ?person, quindi tutto ciò che precede l'ultima
+        # data vista è già stato esaminato (la stessa data si riguarda, i doppioni vengono scartati)
+        state["resumeDeath"] = seen_death
+        state.setdefault("resumeSince", iso(now))
+        save_state(state)
+        print(f"Raggiunto il massimo di {MAX_PAGES} pagine: la prossima esecuzione riprende dai decessi del {seen_death[:10]}.")
+    http_client.print_failure_report()
+
 if __name__ == "__main__":
+    metrics.start_run("updater")
     run_updater()
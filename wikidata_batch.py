@@ -0,0 +1,84 @@
+import urllib.parse
+
+import http_client
+
+SPARQL_URL = http_client.SPARQL_URL
+HEADERS = {
+    'User-Agent': 'iMissYouApp_BatchResolver/1.0 (https://github.com/Gimmons1)',
+    'Accept': 'application/sparql-results+json'
+}
+
+# Quanti articoli per singola query: oltre questa soglia il server di Wikidata
+# inizia a rifiutare o a far scadere le richieste, quindi si spezza in blocchi.
+CHUNK_SIZE = 50
+# Caratteri che wfUrlencode (con cui Wikidata scrive gli IRI di schema:about) lascia in chiaro:
+# apostrofo e "&" restano codificati (Conan_O%27Brien, AT%26T)
+IRI_SAFE = ";@$!*(),/~:"
+
+
+def article_iri(slug, lang="en"):
+    # Stessa codifica degli articoli su Wikidata: con quote() semplice "(cantante)" o "Rome,_Italy" non combaciano
+    return f"https://{lang}.wikipedia.org/wiki/{urllib.parse.quote(slug, safe=IRI_SAFE)}"
+
+
+def clean_date(raw):
+    return raw.split('T')[0].replace('+', '') if raw else None
+
+
+def build_query(iris):
+    values = " ".join(f"<{iri}>" for iri in iris)
+    return f"""
+    SELECT ?article ?item ?causeLabel ?birthDate ?deathDate ?image WHERE {{
+      VALUES ?article {{ {values} }}
+      ?article schema:about ?item .
+      OPTIONAL {{ ?item wdt:P509 ?cause . }}
+      OPTIONAL {{ ?item wdt:P569 ?birthDate . }}
+      OPTIONAL {{ ?item wdt:P570 ?deathDate . }}
+      OPTIONAL {{ ?item wdt:P18 ?image . }}
+      SERVICE wikibase:label {{ bd:serviceParam wikibase:language "it,en". }}
+    }}
+    """
+
+
+def resolve_slugs(slugs, lang="en", chunk_size=CHUNK_SIZE, failed=None):
+    """
+    Risolve molti articoli Wikipedia con una sola query SPARQL per blocco (VALUES ?article).
+    Restituisce {slug: {"qid", "cause", "birthDate", "deathDate", "image"}} solo per gli slug trovati.
+    Come nelle vecchie query con LIMIT 1, se Wikidata ha più valori si tiene il primo.
+    Se viene passato un set `failed`, ci finiscono gli slug dei blocchi andati in errore,
+    così chi chiama può distinguere "non trovato" da "non è stato possibile chiedere".
+    """
+    iri_to_slug = {}
+    for slug in slugs:
+        if slug:
+            iri_to_slug.setdefault(article_iri(slug, lang), slug)
+
+    iris = list(iri_to_slug)
+    resolved = {}
+    for start in range(0, len(iris), chunk_size):
+        chunk = iris[start:start + chunk_size]
+        try:
+            # POST invece di GET: con 50 articoli l'URL supererebbe i limiti di lunghezza
+            res = http_client.post(SPARQL_URL, data={'query': build_query(chunk), 'format': 'json'}, headers=HEADERS, timeout=30)
+            if res.status_code != 200:
+                print(f"Errore Wikidata (HTTP {res.status_code}) su un blocco di {len(chunk)} articoli.")
+                if failed is not None: failed.update(iri_to_slug[iri] for iri in chunk)
+                continue
+            bindings = res.json()['results']['bindings']
+        except Exception as e:
+            print(f"Errore Wikidata su un blocco di {len(chunk)} articoli: {e}")
+            if failed is not None: failed.update(iri_to_slug[iri] for iri in chunk)
+            continue
+
+        for b in bindings:
+            slug = iri_to_slug.get(b['article']['value'])
+            if slug is None or slug in resolved:
+                continue
+            resolved[slug] = {
+                "qid": b['item']['value'].rsplit('/', 1)[-1],
+                "cause": b.get('causeLabel', {}).get('value'),
+                "birthDate": clean_date(b.get('birthDate', {}).get('value')),
+                "deathDate": clean_date(b.get('deathDate', {}).get('value')),
+                "image": b.get('image', {}).get('value'),
+            }
+    return resolved
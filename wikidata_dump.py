@@ -0,0 +1,155 @@
+import bz2
+import gzip
+import json
+import urllib.parse
+
+# Lettura in streaming del dump JSON di Wikidata (latest-all.json.gz / .bz2) o di un suo estratto filtrato.
+# Il dump è un grande array con un'entità per riga: si decomprime e si legge una riga alla volta,
+# quindi la memoria usata non dipende dalla dimensione del file.
+MIN_SITELINKS = 40
+COMMONS_FILE_URL = "http://commons.wikimedia.org/wiki/Special:FilePath/"
+LABEL_LANGUAGES = ["it", "en"]
+# Campo "precision" dei valori temporali di Wikidata
+YEAR_PRECISION = 9
+MONTH_PRECISION = 10
+DAY_PRECISION = 11
+# Calendario giuliano proleptico (calendarmodel): WDQS converte queste date in gregoriano
+JULIAN_CALENDAR = "http://www.wikidata.org/entity/Q1985786"
+
+
+def open_dump(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_entities(path):
+    """Restituisce le entità del dump una alla volta, saltando le righe che non possono essere persone decedute."""
+    with open_dump(path) as f:
+        for line in f:
+            # Filtro veloce sul testo grezzo: evita json.loads sulla quasi totalità delle righe
+            if '"P570"' not in line or '"Q5"' not in line:
+                continue
+            line = line.strip().rstrip(",")
+            try: yield json.loads(line)
+            except: continue  # Riga troncata o non valida: si ignora
+
+
+def best_claim(entity, prop):
+    # Come wdt: in SPARQL, si preferisce il valore "preferred" e si scartano quelli deprecati
+    claims = [c for c in entity.get("claims", {}).get(prop, []) if c.get("rank") != "deprecated"]
+    preferred = [c for c in claims if c.get("rank") == "preferred"]
+    for claim in preferred + claims:
+        value = claim.get("mainsnak", {}).get("datavalue", {}).get("value")
+        if value is not None:
+            return value
+    return None
+
+
+def is_human(entity):
+    for claim in entity.get("claims", {}).get("P31", []):
+        value = claim.get("mainsnak", {}).get("datavalue", {}).get("value", {})
+        if isinstance(value, dict) and value.get("id") == "Q5":
+            return True
+    return False
+
+
+def clean_time(value):
+    """
+    '+1991-11-24T00:00:00Z' -> '1991-11-24', '-0044-03-15T00:00:00Z' -> '-0043-03-15'.
+    Il dump numera gli anni a.C. alla maniera storica (44 a.C. = -0044), SPARQL in modo astronomico
+    (44 a.C. = -0043): si aggiunge 1 agli anni negativi, così le due fonti danno la stessa data.
+    Anche le date nel calendario giuliano si convertono in gregoriano come fa WDQS, ma solo con
+    precisione al giorno: con anno o mese la data diventa comunque il primo giorno utile.
+    Le date meno precise dell'anno (decennio, secolo...) vengono scartate.
+    """
+    if not isinstance(value, dict) or not value.get("time"):
+        return None
+    precision = value.get("precision", DAY_PRECISION)
+    if precision < YEAR_PRECISION:
+        return None
+    raw = value["time"].split("T")[0]
+    parts = raw.lstrip("+-").split("-")
+    if len(parts) != 3:
+        return None
+    try:
+        year = int(parts[0])
+    except ValueError:
+        return None
+    if raw.startswith("-"):
+        year = 1 - year
+    # Oltre la precisione dichiarata le cifre non significano nulla: si usa il primo giorno utile
+    month = int(parts[1]) if precision >= MONTH_PRECISION and parts[1] != "00" else 1
+    day = int(parts[2]) if precision >= DAY_PRECISION and parts[2] != "00" else 1
+    if precision >= DAY_PRECISION and value.get("calendarmodel") == JULIAN_CALENDAR:
+        year, month, day = julian_to_gregorian(year, month, day)
+    sign = "-" if year < 0 else ""
+    return f"{sign}{abs(year):04d}-{month:02d}-{day:02d}"
+
+
+def julian_to_gregorian(year, month, day):
+    """Data giuliana -> gregoriana passando dal numero del giorno giuliano (anni astronomici)."""
+    a = (14 - month) // 12
+    y = year + 4800 - a
+    m = month + 12 * a - 3
+    jdn = day + (153 * m + 2) // 5 + 365 * y + y // 4 - 32083
+    a = jdn + 32044
+    b = (4 * a + 3) // 146097
+    c = a - 146097 * b // 4
+    d = (4 * c + 3) // 1461
+    e = c - 1461 * d // 4
+    m = (5 * e + 2) // 153
+    return 100 * b + d - 4800 + m // 10, m + 3 - 12 * (m // 10), e - (153 * m + 2) // 5 + 1
+
+
+def year_of(date):
+    try:
+        return int(date[:-6])
+    except (TypeError, ValueError):
+        return None
+
+
+def image_url(filename):
+    # Stesso formato degli URL restituiti da SPARQL (spazi come %20)
+    return COMMONS_FILE_URL + urllib.parse.quote(filename) if filename else None
+
+
+def entity_candidate(entity, min_sitelinks=MIN_SITELINKS, start=None, end=None):
+    """
+    Trasforma un'entità del dump nello stesso formato della query SPARQL dell'importatore
+    ({"name", "slug_en", "birth", "death", "image", "sitelinks", "qid"}), oppure None se non va importata.
+    """
+    sitelinks = entity.get("sitelinks", {})
+    if len(sitelinks) < min_sitelinks or not is_human(entity):
+        return None
+    death = clean_time(best_claim(entity, "P570"))
+    birth = clean_time(best_claim(entity, "P569"))
+    if not death or not birth:
+        return None
+    year = year_of(death)
+    if year is None or (start is not None and year < start) or (end is not None and year > end):
+        return None
+
+    labels = entity.get("labels", {})
+    name = next((labels[lang]["value"] for lang in LABEL_LANGUAGES if lang in labels), None)
+    if not name:
+        return None
+    enwiki = sitelinks.get("enwiki", {}).get("title")
+    return {
+        "qid": entity.get("id"),
+        "name": name,
+        "slug_en": enwiki.replace(" ", "_") if enwiki else None,
+        "birth": birth,
+        "death": death,
+        "image": image_url(best_claim(entity, "P18")),
+        "sitelinks": len(sitelinks),
+    }
+
+
+def iter_candidates(path, min_sitelinks=MIN_SITELINKS, start=None, end=None):
+    for entity in iter_entities(path):
+        candidate = entity_candidate(entity, min_sitelinks, start, end)
+        if candidate:
+            yield candidate